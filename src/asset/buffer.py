@@ -1,3 +1,4 @@
+import numpy as np
 from util.io_util import *
 from util.logger import logger
 
@@ -22,6 +23,13 @@ class Buffer:
         write_uint32(f, buffer.size)
         f.write(buffer.buf)
 
+    #skip buffer data without reading it
+    def skip(f):
+        stride = read_uint32(f)
+        size = read_uint32(f)
+        f.seek(stride*size, 1)
+        return stride, size
+
     def print(self, padding=2):
         pad = ' '*padding
         logger.log(pad+'{} (offset: {})'.format(self.name, self.offset))
@@ -36,6 +44,52 @@ class Buffer:
     def get_meta(self):
         return self.offset, self.stride, self.size
 
+#get normals and tangents from packed tangent basis (uint8)
+#quantize: reinterpret them as normalized int8 instead of float32
+def parse_tangent_basis(tangent_basis, quantize=False):
+    if quantize:
+        tangent_basis = (tangent_basis^0x80).view(np.int8)
+        return tangent_basis[:, [4, 6, 5]], tangent_basis[:, [0, 2, 1, 3]]
+    tangent_basis = tangent_basis*(2/255)-1
+    normal = tangent_basis[:, [4, 6, 5]].astype(np.float32)
+    tangent = tangent_basis[:, [0, 2, 1, 3]].astype(np.float32)
+    return normal, tangent
+
+#pack normals and tangents (glTF coordinates) into tangent basis (uint8)
+#the sign of tangent is stored in both tangent and normal.
+def pack_tangent_basis(normal, tangent):
+    tangent_basis = np.empty((len(normal), 8), dtype=np.float32)
+    tangent_basis[:, [0, 2, 1, 3]] = tangent
+    tangent_basis[:, [4, 6, 5]] = normal
+    tangent_basis[:, 7] = tangent[:, 3]
+    return np.clip(np.round((tangent_basis+1)*127.5), 0, 255).astype(np.uint8)
+
+#convert weights to uint8 whose sums are 255
+#influences are sorted by weights like UE4 does, and the smallest ones over max_num are removed.
+#vertices without weights will be influenced by the first joint.
+def pack_skin_weights(joint, weight, max_num=8):
+    order = np.argsort(-weight, axis=1, kind='stable')[:, :max_num]
+    joint = np.take_along_axis(joint, order, axis=1)
+    weight = np.take_along_axis(weight, order, axis=1)
+    total = weight.sum(axis=1, keepdims=True)
+    weight[total[:, 0]<=0, 0] = 1
+    total[total<=0] = 1
+    weight = np.round(weight/total*255).astype(np.int32)
+    weight[:, 0] += 255-weight.sum(axis=1)
+    return joint, weight.astype(np.uint8)
+
+#quantize: get normalized uint16 UVs instead of float32
+def parse_texcoords(texcoords, uv_num, quantize=False):
+    if quantize:
+        return [np.round(texcoords[:, j].astype(np.float32)*65535).astype(np.uint16) for j in range(uv_num)]
+    return [texcoords[:, j].astype(np.float32) for j in range(uv_num)]
+
+#UVs can be quantized only if they are in [0, 1]
+def texcoords_in_unit_range(texcoords):
+    if texcoords.size==0:
+        return True
+    return texcoords.min()>=0 and texcoords.max()<=1
+
 #Vertex buffer
 class VertexBuffer(Buffer):
     def __init__(self, stride, size, buf, offset, name):
@@ -62,13 +116,21 @@ class PositionVertexBuffer(VertexBuffer):
         write_uint32(f, vb.vertex_num)
         Buffer.write(f, vb)
 
-    def parse(self):
-        parsed = struct.unpack('<'+'f'*3*self.size, self.buf)
-        position = [parsed[i*3:i*3+3] for i in range(self.size)]
-        position = [[p/100 for p in pos] for pos in position]
-        position = [[pos[0], pos[2], pos[1]] for pos in position]
+    #positions in UE coordinates
+    def get_parsed(self):
+        return np.frombuffer(self.buf, dtype='<f4', count=self.size*3).reshape(self.size, 3)
+
+    #first, last: range of vertices to parse
+    def parse(self, first=0, last=None):
+        position = self.get_parsed()[first:last]
+        position = position[:, [0, 2, 1]]/100
         return position
 
+    #position: positions in UE coordinates
+    def build(position, name='VB0'):
+        buf = np.ascontiguousarray(position, dtype='<f4').tobytes()
+        return PositionVertexBuffer(12, len(position), buf, None, name)
+
 #Normals and UV maps for static mesh
 class StaticMeshVertexBuffer(VertexBuffer):
     def __init__(self, uv_num, use_float32, stride, size, buf, offset, name):
@@ -99,22 +161,33 @@ class StaticMeshVertexBuffer(VertexBuffer):
         write_null(f)
         Buffer.write(f, vb)
 
-    def parse(self):
-        uv_type = 'f'*self.use_float32+'e'*(not self.use_float32)
-        parsed = struct.unpack('<'+('B'*8+uv_type*2*self.uv_num)*self.size, self.buf)
-        stride = 8+2*self.uv_num
-        normals = [parsed[i*stride:i*stride+8] for i in range(self.size)]
-        normals = [[i*2/255-1 for i in n] for n in normals]
-        normal = [n[4:7] for n in normals]
-        normal = [[n[0], n[2], n[1]] for n in normal]
-        tangent = [n[:4] for n in normals]
-        tangent = [[n[0], n[2], n[1], n[3]] for n in tangent]
-        texcoords = []
-        for j in range(self.uv_num):
-            texcoord = [parsed[i*stride+8+j*2:i*stride+8+j*2+2] for i in range(self.size)]
-            texcoords.append(texcoord)
+    def get_parsed(self):
+        uv_type = '<f4' if self.use_float32 else '<f2'
+        dtype = np.dtype([('tangent_basis', np.uint8, 8), ('texcoords', uv_type, (self.uv_num, 2))])
+        check(dtype.itemsize, self.stride, msg='Parse failed! (StaticMeshVertexBuffer:stride)')
+        return np.frombuffer(self.buf, dtype=dtype, count=self.size)
+
+    def can_quantize_uv(self):
+        return texcoords_in_unit_range(self.get_parsed()['texcoords'])
+
+    #quantize: get int8 normals and tangents
+    #quantize_uv: get uint16 UVs
+    def parse(self, first=0, last=None, quantize=False, quantize_uv=False):
+        parsed = self.get_parsed()[first:last]
+        normal, tangent = parse_tangent_basis(parsed['tangent_basis'], quantize=quantize)
+        texcoords = parse_texcoords(parsed['texcoords'], self.uv_num, quantize=quantize_uv)
         return normal, tangent, texcoords
 
+    #tangent_basis: packed normals and tangents (uint8)
+    #texcoords: UV maps (vertex_num, uv_num, 2)
+    def build(tangent_basis, texcoords, use_float32, name='VB2'):
+        uv_num = texcoords.shape[1]
+        uv_type = '<f4' if use_float32 else '<f2'
+        parsed = np.empty(len(tangent_basis), dtype=[('tangent_basis', np.uint8, 8), ('texcoords', uv_type, (uv_num, 2))])
+        parsed['tangent_basis'] = tangent_basis
+        parsed['texcoords'] = texcoords
+        return StaticMeshVertexBuffer(uv_num, use_float32, parsed.dtype.itemsize, len(parsed), parsed.tobytes(), None, name)
+
 #Vertex colors
 class ColorVertexBuffer(VertexBuffer):
     def read(f, name=''):
@@ -132,6 +205,17 @@ class ColorVertexBuffer(VertexBuffer):
         write_uint32(f, vb.vertex_num)
         Buffer.write(f, vb)
 
+    #returns RGBA colors as uint8 (FColor is stored as BGRA)
+    def parse(self, first=0, last=None):
+        check(self.stride, 4, msg='Parse failed! (ColorVertexBuffer:stride)')
+        parsed = np.frombuffer(self.buf, dtype=np.uint8, count=self.size*4).reshape(self.size, 4)[first:last]
+        return parsed[:, [2, 1, 0, 3]]
+
+    #color: RGBA colors (uint8)
+    def build(color, name='ColorVB'):
+        buf = np.ascontiguousarray(color[:, [2, 1, 0, 3]], dtype=np.uint8).tobytes()
+        return ColorVertexBuffer(4, len(color), buf, None, name)
+
 #Normals, positions, and UV maps for skeletal mesh
 class SkeletalMeshVertexBuffer(VertexBuffer):
     def __init__(self, uv_num, use_float32, scale, stride, size, buf, offset, name):
@@ -159,25 +243,36 @@ class SkeletalMeshVertexBuffer(VertexBuffer):
         write_null_array(f, 3)
         Buffer.write(f, vb)
 
-    def parse(self):
-        uv_type = 'f'*self.use_float32+'e'*(not self.use_float32)
-        parsed = struct.unpack('<'+('B'*8+'fff'+uv_type*2*self.uv_num)*self.size, self.buf)
-        stride = 11+2*self.uv_num
-        normals = [parsed[i*stride:i*stride+8] for i in range(self.size)]
-        normals = [[i*2/255-1 for i in n] for n in normals]
-        normal = [n[4:7] for n in normals]
-        normal = [[n[0], n[2], n[1]] for n in normal]
-        tangent = [n[:4] for n in normals]
-        tangent = [[n[0], n[2], n[1], n[3]] for n in tangent]
-        position = [parsed[i*stride+8:i*stride+11] for i in range(self.size)]
-        position = [[p/100 for p in pos] for pos in position]
-        position = [[pos[0], pos[2], pos[1]] for pos in position]
-        texcoords = []
-        for j in range(self.uv_num):
-            texcoord = [parsed[i*stride+11+j*2:i*stride+11+j*2+2] for i in range(self.size)]
-            texcoords.append(texcoord)
+    def get_parsed(self):
+        uv_type = '<f4' if self.use_float32 else '<f2'
+        dtype = np.dtype([('tangent_basis', np.uint8, 8), ('position', '<f4', 3), ('texcoords', uv_type, (self.uv_num, 2))])
+        check(dtype.itemsize, self.stride, msg='Parse failed! (SkeletalMeshVertexBuffer:stride)')
+        return np.frombuffer(self.buf, dtype=dtype, count=self.size)
+
+    def can_quantize_uv(self):
+        return texcoords_in_unit_range(self.get_parsed()['texcoords'])
+
+    #quantize: get int8 normals and tangents
+    #quantize_uv: get uint16 UVs
+    def parse(self, first=0, last=None, quantize=False, quantize_uv=False):
+        parsed = self.get_parsed()[first:last]
+        normal, tangent = parse_tangent_basis(parsed['tangent_basis'], quantize=quantize)
+        position = parsed['position'][:, [0, 2, 1]]/100
+        texcoords = parse_texcoords(parsed['texcoords'], self.uv_num, quantize=quantize_uv)
         return normal, tangent, position, texcoords
 
+    #tangent_basis: packed normals and tangents (uint8)
+    #position: positions in UE coordinates
+    #texcoords: UV maps (vertex_num, uv_num, 2)
+    def build(tangent_basis, position, texcoords, use_float32, name='VB0'):
+        uv_num = texcoords.shape[1]
+        uv_type = '<f4' if use_float32 else '<f2'
+        parsed = np.empty(len(position), dtype=[('tangent_basis', np.uint8, 8), ('position', '<f4', 3), ('texcoords', uv_type, (uv_num, 2))])
+        parsed['tangent_basis'] = tangent_basis
+        parsed['position'] = position
+        parsed['texcoords'] = texcoords
+        return SkeletalMeshVertexBuffer(uv_num, use_float32, [1, 1, 1], parsed.dtype.itemsize, len(parsed), parsed.tobytes(), None, name)
+
 #Skin weights for skeletal mesh
 class SkinWeightVertexBuffer(VertexBuffer):
     def __init__(self, extra_bone_flag, stride, size, buf, offset, name):
@@ -200,18 +295,27 @@ class SkinWeightVertexBuffer(VertexBuffer):
         write_uint32(f, vb.vertex_num)
         Buffer.write(f, vb)
 
-    def parse(self):
-        parsed = struct.unpack('<'+'B'*len(self.buf), self.buf)
-        joint = [parsed[i*self.stride:i*self.stride+4] for i in range(self.size)]
-        weight = [parsed[i*self.stride+self.stride//2:i*self.stride+self.stride//2+4] for i in range(self.size)]
+    def parse(self, first=0, last=None):
+        parsed = np.frombuffer(self.buf, dtype=np.uint8, count=self.size*self.stride).reshape(self.size, self.stride)[first:last]
+        offset = self.stride//2
+        joint = parsed[:, :4]
+        weight = parsed[:, offset:offset+4]
         if self.extra_bone_flag:
-            joint2 = [parsed[i*self.stride+4:i*self.stride+8] for i in range(self.size)]
-            weight2 = [parsed[i*self.stride+self.stride//2+4:i*self.stride+self.stride//2+8] for i in range(self.size)]
+            joint2 = parsed[:, 4:8]
+            weight2 = parsed[:, offset+4:offset+8]
         else:
             joint2=None
             weight2=None
         return joint, weight, joint2, weight2
 
+    #joint: joint ids for vertex groups (uint8)
+    #weight: weights (uint8)
+    #4 or 8 influences
+    def build(joint, weight, name='VB2'):
+        num = joint.shape[1]
+        parsed = np.concatenate([joint, weight], axis=1).astype(np.uint8)
+        return SkinWeightVertexBuffer(num==8, num*2, len(parsed), parsed.tobytes(), None, name)
+
 #Index buffer for static mesh
 class StaticIndexBuffer(Buffer):
     def __init__(self, uint32_flag, stride, size, ib, offset, name):
@@ -234,10 +338,15 @@ class StaticIndexBuffer(Buffer):
 
     def parse(self):
         _, stride, size = self.get_meta()
-        form = [None, None, 'H', None, 'I']
-        indices = struct.unpack('<'+form[stride]*size, self.buf)
+        form = [None, None, '<u2', None, '<u4']
+        indices = np.frombuffer(self.buf, dtype=form[stride], count=size)
         return indices
 
+    #stored as a byte array
+    def build(indices, uint32_flag, name='IB'):
+        buf = np.ascontiguousarray(indices, dtype='<u4' if uint32_flag else '<u2').tobytes()
+        return StaticIndexBuffer(uint32_flag, 1, len(buf), buf, None, name)
+
 #Index buffer for skeletal mesh
 class SkeletalIndexBuffer(Buffer):
     def read(f, name=''):
@@ -251,10 +360,14 @@ class SkeletalIndexBuffer(Buffer):
         Buffer.write(f, ib)
 
     def parse(self):
-        form = [None, None, 'H', None, 'I']
-        indices = struct.unpack('<'+form[self.stride]*self.size, self.buf)
+        form = [None, None, '<u2', None, '<u4']
+        indices = np.frombuffer(self.buf, dtype=form[self.stride], count=self.size)
         return indices
 
+    def build(indices, stride, name='IB'):
+        buf = np.ascontiguousarray(indices, dtype='<u{}'.format(stride)).tobytes()
+        return SkeletalIndexBuffer(stride, len(indices), buf, None, name)
+
 #KDI buffers
 class KDIBuffer(Buffer):
     def read(f, name=''):
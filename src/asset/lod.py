@@ -1,3 +1,4 @@
+import numpy as np
 from util.io_util import *
 from util.logger import logger
 
@@ -52,10 +53,132 @@ class LOD:
         material_ids = [section.material_id for section in self.sections]
         return material_ids, self.uv_num
 
-def split_list(l, first_ids):
-    last_ids = first_ids[1:]+[len(l)]
-    splitted = [l[first:last] for first, last in zip(first_ids, last_ids)]
-    return splitted
+    #get vertex range of a section
+    #first, last: sub-range in the section (last=None for the end of the section)
+    def get_vertex_range(self, i, first=0, last=None):
+        first_vertex_ids = [section.first_vertex_id for section in self.sections]
+        section_first, section_last = get_ranges(first_vertex_ids, self.vb.vertex_num)[i]
+        if last is None:
+            last = section_last-section_first
+        return min(section_first+first, section_last), min(section_first+last, section_last)
+
+    #get the number of vertices in each section
+    def get_vertex_nums(self):
+        first_vertex_ids = [section.first_vertex_id for section in self.sections]
+        return [last-first for first, last in get_ranges(first_vertex_ids, self.vb.vertex_num)]
+
+    #parse vertex colors of a section (None if LOD has no colors)
+    def parse_colors_for_gltf(self, first, last):
+        if self.color_vb is None:
+            return None
+        return self.color_vb.parse(first, last)
+
+    #parse all vertices and faces for psk (UE coordinates)
+    #returns positions, UV maps, material ids of vertices, indices, material ids of faces, and colors
+    def parse_for_psk(self):
+        position, texcoords = self.parse_positions_and_texcoords()
+        color = None if self.color_vb is None else self.color_vb.parse()
+        material_ids = [section.material_id for section in self.sections]
+        vertex_ranges = get_ranges([section.first_vertex_id for section in self.sections], self.vb.vertex_num)
+        indices = self.ib.parse()
+        face_ranges = get_ranges([section.first_ib_id for section in self.sections], len(indices))
+        vertex_material_ids = np.repeat(material_ids, [last-first for first, last in vertex_ranges])
+        face_material_ids = np.repeat(material_ids, [(last-first)//3 for first, last in face_ranges])
+        return position, texcoords, vertex_material_ids, indices, face_material_ids, color
+
+    #parse indices of a section (rebased to the first vertex of the section)
+    def parse_indices_for_gltf(self, i):
+        indices = self.ib.parse()
+        first_ib_ids = [section.first_ib_id for section in self.sections]
+        first, last = get_ranges(first_ib_ids, len(indices))[i]
+        return indices[first:last]-self.sections[i].first_vertex_id
+
+#LOD data which will be parsed on first access.
+#LODs store byte ranges and header info when loading,
+#and unparsed LODs are written as raw bytes.
+class LazyLOD:
+    def __init__(self, f, read_func, write_func, skim_func):
+        object.__setattr__(self, 'f', f)
+        object.__setattr__(self, 'offset', f.tell())
+        object.__setattr__(self, 'header', skim_func(f))
+        object.__setattr__(self, 'size', f.tell()-self.offset)
+        object.__setattr__(self, 'read_func', read_func)
+        object.__setattr__(self, 'write_func', write_func)
+        object.__setattr__(self, 'lod', None)
+
+    def get_lod(self):
+        if self.lod is None:
+            pos=self.f.tell()
+            self.f.seek(self.offset)
+            object.__setattr__(self, 'lod', self.read_func(self.f))
+            check(self.f.tell(), self.offset+self.size, self.f, 'Parse failed! (LOD:size)')
+            self.f.seek(pos)
+        return self.lod
+
+    def __getattr__(self, name):
+        return getattr(self.get_lod(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get_lod(), name, value)
+
+    def write(f, lod):
+        if lod.lod is None:
+            pos=lod.f.tell()
+            lod.f.seek(lod.offset)
+            f.write(lod.f.read(lod.size))
+            lod.f.seek(pos)
+        else:
+            lod.write_func(f, lod.lod)
+
+    def print(self, name, *args, padding=0):
+        if self.lod is not None:
+            self.lod.print(name, *args, padding=padding)
+            return
+        pad=' '*padding
+        logger.log(pad+'LOD{} (offset: {}, size: {})'.format(name, self.offset, self.size))
+        for key, value in self.header.items():
+            logger.log(pad+'  {}: {}'.format(key, value))
+
+#get (first id, last id) for each section
+def get_ranges(first_ids, num):
+    return list(zip(first_ids, first_ids[1:]+[num]))
+
+#merge glTF primitives into vertex arrays (UE coordinates) and an index array
+#returns merged data, first vertex ids, and first index ids of primitives
+def merge_primitives(primitives):
+    vertex_nums = [len(p['position']) for p in primitives]
+    first_vertex_ids = np.concatenate([[0], np.cumsum(vertex_nums)[:-1]]).astype(np.int64)
+    index_nums = [len(p['indices']) for p in primitives]
+    first_ib_ids = np.concatenate([[0], np.cumsum(index_nums)[:-1]]).astype(np.int64)
+
+    position = np.concatenate([p['position'] for p in primitives])[:, [0, 2, 1]]*100
+    normal = np.concatenate([p['normal'] for p in primitives])
+    tangent = np.concatenate([p['tangent'] for p in primitives])
+    tangent_basis = pack_tangent_basis(normal, tangent)
+
+    #missing UV maps are filled with zeros
+    uv_num = max(1, max([len(p['texcoords']) for p in primitives]))
+    texcoords = np.zeros((len(position), uv_num, 2), dtype=np.float32)
+    for p, first in zip(primitives, first_vertex_ids):
+        for uv, j in zip(p['texcoords'], range(len(p['texcoords']))):
+            texcoords[first:first+len(uv), j] = uv
+
+    #missing colors are filled with white
+    color = None
+    if any([p['color'] is not None for p in primitives]):
+        color = np.full((len(position), 4), 255, dtype=np.uint8)
+        for p, first in zip(primitives, first_vertex_ids):
+            if p['color'] is None:
+                continue
+            c = p['color']
+            if c.dtype.kind=='f':
+                c = np.clip(np.round(c*255), 0, 255)
+            color[first:first+len(c), :c.shape[1]] = c
+
+    indices = np.concatenate([p['indices'].astype(np.int64)+first for p, first in zip(primitives, first_vertex_ids)])
+    merged = {'position': position, 'tangent_basis': tangent_basis, 'texcoords': texcoords,
+              'color': color, 'indices': indices, 'vertex_nums': vertex_nums, 'index_nums': index_nums}
+    return merged, first_vertex_ids, first_ib_ids
 
 #LOD for static mesh
 class StaticLOD(LOD):
@@ -101,6 +224,36 @@ class StaticLOD(LOD):
         unk = f.read(48)
         return StaticLOD(offset, sections, flags, vb, vb2, color_vb, ib, ib2, unk)
 
+    #skip LOD data and return header info
+    def skim(f):
+        one = read_uint16(f)
+        check(one, 1, f)
+        section_num = read_uint32(f)
+        f.seek(section_num*28+4, 1)
+
+        f.seek(8, 1)
+        _, vertex_num = Buffer.skip(f) #VB0
+        f.seek(2, 1)
+        uv_num = read_uint32(f)
+        f.seek(16, 1)
+        Buffer.skip(f) #VB2
+
+        one = read_uint32(f)
+        if one!=1:
+            f.seek(6, 1)
+            Buffer.skip(f) #ColorVB
+        else:
+            f.seek(6, 1)
+
+        uint32_flag = read_uint32(f)
+        stride, size = Buffer.skip(f) #IB
+        f.seek(12, 1)
+        f.seek(4, 1) #uint32 flag of IB2
+        Buffer.skip(f) #IB2
+        f.seek(48, 1)
+        face_num = stride*size//(2+2*uint32_flag)//3
+        return {'section_num': section_num, 'face_num': face_num, 'vertex_num': vertex_num, 'uv_num': uv_num}
+
     def write(f, lod):
         write_uint16(f, 1)
         write_array(f, lod.sections, StaticLODSection.write, with_length=True)
@@ -137,22 +290,49 @@ class StaticLOD(LOD):
         self.flags = lod.flags
         #self.unk = new_lod.unk #if import this, umodel will crash
 
-    def parse_buffers_for_gltf(self):
-        pos = self.vb.parse()
-        normal, tangent, texcoords = self.vb2.parse()
-        first_vertex_ids = [section.first_vertex_id for section in self.sections]
-
-        ls = [normal, tangent, pos]
-        normals, tangents, positions = [split_list(l, first_vertex_ids) for l in ls]
-
-        texcoords = [split_list(l, first_vertex_ids) for l in texcoords]
-
-        indices = self.ib.parse()
-        first_ib_ids = [section.first_ib_id for section in self.sections]
-        indices = split_list(indices, first_ib_ids)
-        indices = [[i-first_id for i in ids] for ids, first_id in zip(indices, first_vertex_ids)]
-        
-        return normals, tangents, positions, texcoords, indices
+    #UVs can be quantized if they are in [0, 1]
+    def can_quantize_uv(self):
+        return self.vb2.can_quantize_uv()
+
+    #parse vertex buffers of a section
+    #quantize, quantize_uv: get quantized data for KHR_mesh_quantization
+    #first, last: sub-range in the section (to parse large sections in chunks)
+    def parse_vertices_for_gltf(self, i, first=0, last=None, quantize=False, quantize_uv=False):
+        first, last = self.get_vertex_range(i, first=first, last=last)
+        pos = self.vb.parse(first, last)
+        normal, tangent, texcoords = self.vb2.parse(first, last, quantize=quantize, quantize_uv=quantize_uv)
+        color = self.parse_colors_for_gltf(first, last)
+        return normal, tangent, pos, texcoords, color, None, None, None, None
+
+    def parse_positions_and_texcoords(self):
+        return self.vb.get_parsed(), self.vb2.get_parsed()['texcoords']
+
+    #build LOD from glTF primitives. this LOD is used as a template of buffer settings.
+    #material_ids: material ids of primitives
+    def from_gltf(self, primitives, material_ids):
+        merged, first_vertex_ids, first_ib_ids = merge_primitives(primitives)
+        position = merged['position']
+        indices = merged['indices']
+        uint32_flag = int(len(position)>65536)
+
+        #index buffer for depth only pass (vertices with the same position are merged)
+        _, first_ids, inverse = np.unique(position, axis=0, return_index=True, return_inverse=True)
+        depth_indices = first_ids[inverse.reshape(-1)][indices]
+
+        sections = []
+        for i in range(len(primitives)):
+            first = int(first_vertex_ids[i])
+            section = StaticLODSection.build(material_ids[i], int(first_ib_ids[i]), merged['index_nums'][i]//3,
+                                             first, first+max(merged['vertex_nums'][i]-1, 0))
+            sections.append(section)
+
+        vb = PositionVertexBuffer.build(position)
+        vb2 = StaticMeshVertexBuffer.build(merged['tangent_basis'], merged['texcoords'], self.vb2.use_float32)
+        color_vb = None if merged['color'] is None else ColorVertexBuffer.build(merged['color'])
+        ib = StaticIndexBuffer.build(indices, uint32_flag)
+        ib2 = StaticIndexBuffer.build(depth_indices, uint32_flag, name='IB2')
+        lod = StaticLOD(None, sections, self.flags, vb, vb2, color_vb, ib, ib2, self.unk)
+        return lod
 
 #LOD for skeletal mesh
 class SkeletalLOD(LOD):
@@ -162,7 +342,17 @@ class SkeletalLOD(LOD):
     #bone_ids: active bone ids?
     #uv_num: the number of uv maps
 
-    def __init__(self, f, ff7r=True):
+    def __init__(self, f=None, ff7r=True):
+        if f is None:
+            #empty LOD without KDI (for LODs built from glTF)
+            self.offset=None
+            self.sections=[]
+            self.KDI_buffer_size=0
+            self.KDI_buffer=None
+            self.KDI_VB=None
+            self.null8=False
+            self.unk_ids=None
+            return
         self.offset=f.tell()
         one = read_uint16(f)
         check(one, 1, f, 'Parse failed! (LOD:one)')
@@ -224,6 +414,56 @@ class SkeletalLOD(LOD):
 
     def read(f, ff7r):
         return SkeletalLOD(f, ff7r=ff7r)
+
+    #skip LOD data and return header info
+    def skim(f, ff7r=True):
+        one = read_uint16(f)
+        check(one, 1, f, 'Parse failed! (LOD:one)')
+        section_num = read_uint32(f)
+        KDI_buffer_size = 0
+        for i in range(section_num):
+            KDI_buffer_size += SkeletalLODSection.skim(f, ff7r=ff7r)
+
+        f.seek(1, 1)
+        _, ib_size = Buffer.skip(f) #IB
+        num = read_uint32(f)
+        f.seek(num*2+4, 1)
+        vertex_num = read_uint32(f)
+        num = read_uint32(f)
+        f.seek(num*2, 1)
+
+        i = read_uint32(f)
+        if i==0:
+            f.seek(4, 1)
+        else:
+            f.seek(-4, 1)
+        chk = read_uint32(f)
+        if chk==vertex_num:
+            f.seek((vertex_num+1)*4, 1)
+        else:
+            f.seek(-4, 1)
+
+        uv_num = read_uint32(f)
+        f.seek(34, 1)
+        Buffer.skip(f) #VB0
+        f.seek(10, 1)
+        Buffer.skip(f) #VB2
+
+        u = read_uint8(f)
+        f.seek(-1, 1)
+        if u==1:
+            f.seek(10, 1)
+            Buffer.skip(f) #ColorVB
+
+        f.seek(1, 1)
+        Buffer.skip(f) #IB2
+
+        if KDI_buffer_size>0:
+            f.seek(2, 1)
+            Buffer.skip(f) #KDI buffer
+            f.seek(2, 1)
+            Buffer.skip(f) #KDI VB
+        return {'section_num': section_num, 'face_num': ib_size//3, 'vertex_num': vertex_num, 'uv_num': uv_num}
     
     def write(f, lod):
         write_uint16(f, 1)
@@ -296,32 +536,121 @@ class SkeletalLOD(LOD):
         for section in self.sections:
             section.remove_KDI()
 
-    def parse_buffers_for_gltf(self):
-        normal, tangent, pos, texcoords = self.vb.parse()
-        joint, weight, joint2, weight2 = self.vb2.parse()
-        first_vertex_ids = [section.first_vertex_id for section in self.sections]
-        vertex_groups = [section.vertex_group for section in self.sections]
-
-        ls = [normal, tangent, pos, joint, weight]
-        normals, tangents, positions, joints, weights = [split_list(l, first_vertex_ids) for l in ls]
-
-        texcoords = [split_list(l, first_vertex_ids) for l in texcoords]
-
-        def func(vertex_groups, joints, weights):
-            return [[[vg[j[i]]*(w[i]!=0) for i in range(4)] for j, w in zip(joint, weight)] for joint, weight, vg in zip(joints, weights, vertex_groups)]
-
-        joints = func(vertex_groups, joints, weights)
-        
+    #convert joint ids in a section (ids for vertex group) to bone ids
+    #joints with no weight will be 0
+    def remap_joints(joint, weight, vertex_group):
+        vertex_group = np.asarray(vertex_group, dtype=np.uint16)
+        joint = vertex_group[joint]
+        joint[weight==0] = 0
+        return joint
+
+    #UVs can be quantized if they are in [0, 1]
+    def can_quantize_uv(self):
+        return self.vb.can_quantize_uv()
+
+    #parse vertex buffers of a section
+    #quantize, quantize_uv: get quantized data for KHR_mesh_quantization
+    #first, last: sub-range in the section (to parse large sections in chunks)
+    def parse_vertices_for_gltf(self, i, first=0, last=None, quantize=False, quantize_uv=False):
+        first, last = self.get_vertex_range(i, first=first, last=last)
+        vertex_group = self.sections[i].vertex_group
+        normal, tangent, pos, texcoords = self.vb.parse(first, last, quantize=quantize, quantize_uv=quantize_uv)
+        color = self.parse_colors_for_gltf(first, last)
+        joint, weight, joint2, weight2 = self.vb2.parse(first, last)
+        joint = SkeletalLOD.remap_joints(joint, weight, vertex_group)
         if joint2 is not None:
-            ls = [joint2, weight2]
-            joints2, weights2 = [split_list(l, first_vertex_ids) for l in ls]
-            joints2 = func(vertex_groups, joints2, weights2)
-        else:
-            joints2, weights2 = None, None
-
-        indices = self.ib.parse()
-        first_ib_ids = [section.first_ib_id for section in self.sections]
-        indices = split_list(indices, first_ib_ids)
-        indices = [[i-first_id for i in ids] for ids, first_id in zip(indices, first_vertex_ids)]
-        
-        return normals, tangents, positions, texcoords, joints, weights, joints2, weights2, indices
\ No newline at end of file
+            joint2 = SkeletalLOD.remap_joints(joint2, weight2, vertex_group)
+        return normal, tangent, pos, texcoords, color, joint, weight, joint2, weight2
+
+    def parse_positions_and_texcoords(self):
+        parsed = self.vb.get_parsed()
+        return parsed['position'], parsed['texcoords']
+
+    #build LOD from glTF primitives. this LOD is used as a template of buffer settings.
+    #material_ids: material ids of primitives
+    #joint_names: names of joints in glTF skin
+    #bones: bones of the skeleton
+    def from_gltf(self, primitives, material_ids, joint_names, bones):
+        if joint_names is None:
+            raise RuntimeError('Skin not found. Export the mesh with an armature.')
+        bone_ids = {b.name: i for b, i in zip(bones, range(len(bones)))}
+        for name in joint_names:
+            if name not in bone_ids:
+                raise RuntimeError('Bone not found in the skeleton. ({})'.format(name))
+        joint_to_bone = np.array([bone_ids[name] for name in joint_names], dtype=np.int64)
+
+        merged, first_vertex_ids, first_ib_ids = merge_primitives(primitives)
+        position = merged['position']
+        indices = merged['indices']
+
+        #bone ids and uint8 weights sorted by weights
+        joints = []
+        weights = []
+        for p in primitives:
+            if p['joints'] is None:
+                raise RuntimeError('Vertices without weights detected. Export the mesh with weights.')
+            joint, weight = pack_skin_weights(joint_to_bone[p['joints']], p['weights'])
+            joints.append(joint)
+            weights.append(weight)
+        joint = np.zeros((len(position), 8), dtype=np.int64)
+        weight = np.zeros((len(position), 8), dtype=np.uint8)
+        for j, w, first in zip(joints, weights, first_vertex_ids):
+            joint[first:first+len(j), :j.shape[1]] = j
+            weight[first:first+len(w), :w.shape[1]] = w
+        influence_num = 8 if (weight[:, 4:]>0).any() else 4
+        joint = joint[:, :influence_num]
+        weight = weight[:, :influence_num]
+        #joints with no weight use the main bone
+        joint = np.where(weight>0, joint, joint[:, :1])
+
+        #bone ids to joint ids for vertex groups
+        lod = SkeletalLOD(ff7r=False)
+        used_bones = set()
+        for i in range(len(primitives)):
+            first = int(first_vertex_ids[i])
+            last = first+merged['vertex_nums'][i]
+            vertex_group = np.unique(joint[first:last])
+            if len(vertex_group)>256:
+                raise RuntimeError('Too many bones in a section. ({})'.format(len(vertex_group)))
+            joint[first:last] = np.searchsorted(vertex_group, joint[first:last])
+            used_bones.update(vertex_group.tolist())
+            section = SkeletalLODSection.build(material_ids[i], int(first_ib_ids[i]), merged['index_nums'][i]//3,
+                                               vertex_group.tolist(), first, last-first, influence_num)
+            lod.sections.append(section)
+
+        lod.vb = SkeletalMeshVertexBuffer.build(merged['tangent_basis'], position, merged['texcoords'], self.vb.use_float32)
+        lod.vb2 = SkinWeightVertexBuffer.build(joint, weight)
+        lod.color_vb = None if merged['color'] is None else ColorVertexBuffer.build(merged['color'])
+        stride = 2+2*int(len(position)>65536)
+        lod.ib = SkeletalIndexBuffer.build(indices, stride)
+        lod.ib2 = SkeletalIndexBuffer.build(indices[:0], stride, name='IB2')
+        lod.uv_num = lod.vb.uv_num
+
+        #used bones and their parents
+        for i in list(used_bones):
+            while bones[i].parent>=0 and bones[i].parent not in used_bones:
+                i = bones[i].parent
+                used_bones.add(i)
+        lod.active_bone_ids = SkeletalLOD.add_bone_ids(self.active_bone_ids, used_bones)
+        lod.required_bone_ids = SkeletalLOD.add_bone_ids(self.required_bone_ids, used_bones)
+        return lod
+
+    #add bone ids to a uint16 array (bytes)
+    def add_bone_ids(bone_ids, new_ids):
+        bone_ids = set(np.frombuffer(bone_ids, dtype='<u2').tolist()) | new_ids
+        return np.array(sorted(bone_ids), dtype='<u2').tobytes()
+
+    #parse bone ids and weights of all vertices for psk
+    #joints with extra bones are concatenated. (8 influences)
+    def parse_weights_for_psk(self):
+        joints = []
+        weights = []
+        for section, i in zip(self.sections, range(len(self.sections))):
+            first, last = self.get_vertex_range(i)
+            joint, weight, joint2, weight2 = self.vb2.parse(first, last)
+            if joint2 is not None:
+                joint = np.concatenate([joint, joint2], axis=1)
+                weight = np.concatenate([weight, weight2], axis=1)
+            joints.append(SkeletalLOD.remap_joints(joint, weight, section.vertex_group))
+            weights.append(weight)
+        return np.concatenate(joints), np.concatenate(weights)
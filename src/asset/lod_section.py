@@ -1,5 +1,6 @@
 from util.io_util import *
 from util.logger import logger
+from util.record import Record
 
 #Base class for LOD sections
 class LODSection:
@@ -11,26 +12,37 @@ class LODSection:
 
 #LOD section for static mesh
 class StaticLODSection(LODSection):
-    def __init__(self, f):
-        self.material_id = read_uint32(f)
-        self.first_ib_id = read_uint32(f)
-        self.face_num = read_uint32(f)
-        self.first_vertex_id = read_uint32(f)
-        self.last_vertex_id = read_uint32(f)
-        self.enable_collision = read_uint32(f)
-        self.cast_shadow = read_uint32(f)
+    RECORD = Record([
+        ('material_id', 'I'),
+        ('first_ib_id', 'I'),
+        ('face_num', 'I'),
+        ('first_vertex_id', 'I'),
+        ('last_vertex_id', 'I'),
+        ('enable_collision', 'I'),
+        ('cast_shadow', 'I')
+    ])
+
+    def __init__(self, f=None):
+        if f is not None:
+            StaticLODSection.RECORD.read(f, self)
 
     def read(f):
         return StaticLODSection(f)
 
+    #make a new section (for LODs built from glTF)
+    def build(material_id, first_ib_id, face_num, first_vertex_id, last_vertex_id, enable_collision=1, cast_shadow=1):
+        section = StaticLODSection()
+        section.material_id = material_id
+        section.first_ib_id = first_ib_id
+        section.face_num = face_num
+        section.first_vertex_id = first_vertex_id
+        section.last_vertex_id = last_vertex_id
+        section.enable_collision = enable_collision
+        section.cast_shadow = cast_shadow
+        return section
+
     def write(f, section):
-        write_uint32(f, section.material_id)
-        write_uint32(f, section.first_ib_id)
-        write_uint32(f, section.face_num)
-        write_uint32(f, section.first_vertex_id)
-        write_uint32(f, section.last_vertex_id)
-        write_uint32(f, section.enable_collision)
-        write_uint32(f, section.cast_shadow)
+        StaticLODSection.RECORD.write(f, section)
 
     def import_section(self, section):
         self.not_first = section.not_first
@@ -65,35 +77,38 @@ class SkeletalLODSection(LODSection):
     UNK=b'\x00\xFF\xFF'
     CorrespondClothAssetIndex=b'\xCD\xCD'
 
-    def __init__(self, f, ff7r=True):
+    HEAD = Record([
+        (None, 'H', 1, 'Parse failed! (LOD_Section:StripFlags)'),
+        ('material_id', 'H'),
+        ('first_ib_id', 'I'),
+        ('face_num', 'I'),
+        (None, 'I', 0, 'Parse failed! (LOD_Section:Number of Faces)'),
+        (None, '3s', UNK, 'Parse failed! (LOD_Section:1)'),
+        ('unk', '1s'),
+        (None, 'I', 0, 'Parse failed! (LOD_Section:2)'),
+        (None, 'I', 1, 'Parse failed! (LOD_Section:3)'),
+        ('first_vertex_id', 'I')
+    ])
+
+    #after vertex_group
+    BODY = Record([
+        ('vertex_num', 'I'),
+        ('max_bone_influences', 'I'),
+        (None, '12s', b'\x00'*12, 'Parse failed! (LOD_Section:4)'),
+        (None, '2s', CorrespondClothAssetIndex, 'Parse failed! (LOD_Section:CorrespondClothAssetIndex)'),
+        (None, '16s', b'\x00'*16, 'LOD_Section:ClothingSectionData: GUID should be null.'),
+        (None, 'i', -1, 'LOD_Section:ClothingSectionData: AssetLodIndex should be -1.')
+    ])
+
+    def __init__(self, f=None, ff7r=True):
         self.ff7r=ff7r
-        one = read_uint16(f)
-        check(one, 1, f, 'Parse failed! (LOD_Section:StripFlags)')
-        self.material_id=read_uint16(f)
-
-        self.first_ib_id=read_uint32(f)
-
-        self.face_num = read_uint32(f)
-        read_null(f, 'Parse failed! (LOD_Section:Number of Faces)')
-        unk=f.read(3)
-        check(unk, SkeletalLODSection.UNK, f, 'Parse failed! (LOD_Section:1)')
-        self.unk=f.read(1)
-        read_null(f, 'Parse failed! (LOD_Section:2)')
-        read_const_uint32(f, 1, 'Parse failed! (LOD_Section:3)')
-        self.first_vertex_id=read_uint32(f)
-
+        if f is None:
+            self.unk1=None
+            self.unk2=None
+            return
+        SkeletalLODSection.HEAD.read(f, self)
         self.vertex_group=read_uint16_array(f)
-
-        self.vertex_num=read_uint32(f)
-
-        self.max_bone_influences=read_uint32(f)
-
-        read_null_array(f, 3, 'Parse failed! (LOD_Section:4)')
-        cloth_asset_index=f.read(2)
-        check(cloth_asset_index, SkeletalLODSection.CorrespondClothAssetIndex, f, 'Parse failed! (LOD_Section:CorrespondClothAssetIndex)')
-        read_null_array(f,4, 'LOD_Section:ClothingSectionData: GUID should be null.')
-        unknown=read_int32(f)
-        check(unknown, -1, f, 'LOD_Section:ClothingSectionData: AssetLodIndex should be -1.')
+        SkeletalLODSection.BODY.read(f, self)
 
         if ff7r:
             self.unk1=read_uint32(f)
@@ -110,23 +125,35 @@ class SkeletalLODSection(LODSection):
         section=SkeletalLODSection(f, ff7r=True)
         return section
 
+    #make a new section without KDI (for LODs built from glTF)
+    def build(material_id, first_ib_id, face_num, vertex_group, first_vertex_id, vertex_num, max_bone_influences, unk=b'\x01'):
+        section = SkeletalLODSection(ff7r=False)
+        section.material_id = material_id
+        section.first_ib_id = first_ib_id
+        section.face_num = face_num
+        section.unk = unk
+        section.vertex_group = vertex_group
+        section.first_vertex_id = first_vertex_id
+        section.vertex_num = vertex_num
+        section.max_bone_influences = max_bone_influences
+        return section
+
+    #skip section data and return the number of vertices influenced by KDI
+    def skim(f, ff7r=True):
+        f.seek(SkeletalLODSection.HEAD.size, 1)
+        vertex_group_num=read_uint32(f)
+        f.seek(vertex_group_num*2+SkeletalLODSection.BODY.size, 1)
+        if ff7r:
+            f.seek(4, 1)
+            num=read_uint32(f)
+            f.seek(num*16, 1)
+            return num
+        return 0
+
     def write(f, section):
-        write_uint16(f, 1)
-        write_uint16(f, section.material_id)
-        write_uint32(f, section.first_ib_id)
-        write_uint32(f, section.face_num)
-        write_null(f)
-        f.write(SkeletalLODSection.UNK)
-        f.write(section.unk)
-        write_uint32_array(f,[0,1])
-        write_uint32(f, section.first_vertex_id)
+        SkeletalLODSection.HEAD.write(f, section)
         write_uint16_array(f, section.vertex_group, with_length=True)
-        write_uint32(f, section.vertex_num)
-        write_uint32(f, section.max_bone_influences)
-        write_null_array(f,3)
-        f.write(SkeletalLODSection.CorrespondClothAssetIndex)
-        write_null_array(f, 4)
-        write_int32(f,-1)
+        SkeletalLODSection.BODY.write(f, section)
         if section.ff7r and section.unk1 is not None:
             write_uint32(f, section.unk1)
             write_uint32(f, len(section.unk2)//16)
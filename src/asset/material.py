@@ -99,3 +99,9 @@ class SkeletalMaterial(Material):
         write_int32(f, material.import_id)
         write_uint32(f, material.slot_name_id)
         f.write(material.bin)
+
+#material which only has a name (for glTF)
+class NamedMaterial(Material):
+    def __init__(self, name):
+        super().__init__(None, None, None)
+        self.import_name = name
@@ -1,13 +1,16 @@
-import os, json
+import os, re, json, copy, functools
+import numpy as np
 from util.io_util import *
 from util.logger import logger
 
-from asset.lod import StaticLOD, SkeletalLOD
+from asset.lod import StaticLOD, SkeletalLOD, LazyLOD
 from asset.skeleton import Skeleton
-from asset.material import Material, StaticMaterial, SkeletalMaterial
+from asset.material import Material, StaticMaterial, SkeletalMaterial, NamedMaterial
 from asset.buffer import Buffer
 
 from gltf.gltf import glTF
+from gltf.skin import SkinCache
+from psk.psk import PSK
 
 #Base class for mesh
 class Mesh:
@@ -24,6 +27,11 @@ class Mesh:
 
         logger.log('LOD1~{} have been removed.'.format(num-1), ignore_verbose=True)
 
+    #parse all LODs. (LODs are parsed on first access, and unparsed LODs are written as raw bytes.)
+    def parse_LODs(self):
+        for lod in self.LODs:
+            lod.get_lod()
+
     def import_LODs(self, mesh, ignore_material_names=False):
         new_material_ids = Material.check_confliction(self.materials, mesh.materials, ignore_material_names=ignore_material_names)
         
@@ -37,6 +45,67 @@ class Mesh:
             new_lod.update_material_ids(new_material_ids)
             self.LODs[i].import_LOD(new_lod, str(i))
 
+    #get a copy of this mesh which has LODs loaded from glTF
+    #meshes in glTF are LODs (physical meshes are ignored), and LODs of this mesh are used as templates.
+    def load_gltf(self, reader):
+        mesh_ids = [i for name, i in zip(reader.get_mesh_names(), range(len(reader.get_mesh_names()))) if re.search(r'_phy\d+$', name) is None]
+        if len(mesh_ids)==0:
+            raise RuntimeError('Meshes not found in glTF. ({})'.format(reader.file))
+        meshes = [reader.get_mesh(i) for i in mesh_ids[:len(self.LODs)]]
+
+        material_names = []
+        for primitives, _ in meshes:
+            for p in primitives:
+                if p['material'] is None:
+                    raise RuntimeError('Primitives without materials detected. Assign materials to all faces.')
+                if p['material'] not in material_names:
+                    material_names.append(p['material'])
+
+        mesh = copy.copy(self)
+        mesh.materials = [NamedMaterial(name) for name in material_names]
+        mesh.LODs = []
+        for (primitives, joint_names), i in zip(meshes, range(len(meshes))):
+            material_ids = [material_names.index(p['material']) for p in primitives]
+            mesh.LODs.append(self.LOD_from_gltf(i, primitives, material_ids, joint_names))
+        return mesh
+
+    #lods: None (LOD0), 'all', or comma separated ids (e.g. '0,2,3')
+    def get_LOD_ids(self, lods):
+        if lods is None:
+            return [0]
+        if lods=='all':
+            return list(range(len(self.LODs)))
+        try:
+            ids = [int(i) for i in lods.split(',')]
+        except ValueError:
+            raise RuntimeError('Invalid LOD ids. ({})'.format(lods))
+        for i in ids:
+            if i<0 or i>=len(self.LODs):
+                raise RuntimeError('LOD{} not found. (LOD num: {})'.format(i, len(self.LODs)))
+        return ids
+
+    def get_LOD_name(self, name, i, lods):
+        if lods is None:
+            return name
+        return name+'_LOD{}'.format(i)
+
+    #quantize: use KHR_mesh_quantization (int8 normals and tangents, and uint16 UVs if they are in [0, 1])
+    def get_vertex_parser(self, i, quantize=False):
+        lod = self.LODs[i]
+        quantize_uv = quantize and lod.can_quantize_uv()
+        return functools.partial(lod.parse_vertices_for_gltf, quantize=quantize, quantize_uv=quantize_uv)
+
+    def save_as_gltf(self, name, save_folder, file_format='gltf', lods=None, jobs=1, include_phy=False, quantize=False, meshopt=False):
+        gltf = glTF()
+        self.add_to_gltf(gltf, name, lods=lods, include_phy=include_phy, quantize=quantize)
+        gltf.save(name, save_folder, file_format=file_format, jobs=jobs, meshopt=meshopt)
+
+    #export LODs as psk files (one file for each LOD)
+    def save_as_psk(self, name, save_folder, lods=None):
+        for i in self.get_LOD_ids(lods):
+            psk = self.LOD_to_psk(i)
+            psk.save(os.path.join(save_folder, self.get_LOD_name(name, i, lods)+self.PSK_EXT))
+
     def dump_buffers(self, save_folder):
         logs={}
         for lod,i in zip(self.LODs, range(len(self.LODs))):
@@ -56,22 +125,21 @@ class Mesh:
 
     def seek_materials(f, imports):
         offset=f.tell()
-        buf=f.read(3)
         while (True):
-            while (buf!=b'\xFF\xFF\xFF'):
-                buf=b''.join([buf[1:], f.read(1)])
-                if f.tell()-offset>10000:
-                    raise RuntimeError('Material properties not found. This is an unexpected error.')
-            f.seek(-4,1)
+            pos=find_bytes(f, b'\xFF\xFF\xFF', max_size=offset+10000-f.tell())
+            if pos<0:
+                raise RuntimeError('Material properties not found. This is an unexpected error.')
+            f.seek(pos-1)
             import_id=-read_int32(f)-1
             if imports[import_id].material:
                 break
             f.seek(4,1)
-            buf=f.read(3)
         return
 
 #static mesh
 class StaticMesh(Mesh):
+    PSK_EXT = '.pskx'
+
     def __init__(self, unk, materials, LODs):
         self.unk = unk
         self.materials = materials
@@ -94,32 +162,45 @@ class StaticMesh(Mesh):
             
         Material.print_materials(materials, name_list, imports, material_offset)
         
-        buf=f.read(6)
-        while (buf!=b'\x01\x00\x01\x00\x00\x00'):
-            buf=b''.join([buf[1:], f.read(1)])
+        pos=find_bytes(f, b'\x01\x00\x01\x00\x00\x00')
+        if pos<0:
+            raise RuntimeError('LOD data not found. This is an unexpected error.')
+        f.seek(pos+6)
         unk_size=f.tell()-offset+28
 
         f.seek(offset)
         unk = f.read(unk_size)
-        LODs = read_array(f, StaticLOD.read)
+        LODs = read_array(f, StaticMesh.read_LOD)
         for i in range(len(LODs)):
             LODs[i].print(i)
         return StaticMesh(unk, materials, LODs)
 
+    def read_LOD(f):
+        return LazyLOD(f, StaticLOD.read, StaticLOD.write, StaticLOD.skim)
+
     def write(f, staticmesh):
         f.write(staticmesh.unk)
-        write_array(f, staticmesh.LODs, StaticLOD.write, with_length=True)
+        write_array(f, staticmesh.LODs, LazyLOD.write, with_length=True)
     
-    def save_as_gltf(self, name, save_folder):
-        material_names = [m.import_name for m in self.materials]
-        material_ids, uv_num = self.LODs[0].get_meta_for_gltf()
-        gltf = glTF(None, material_names, material_ids, uv_num)
-        normals, tangents, positions, texcoords, indices= self.LODs[0].parse_buffers_for_gltf()
-        gltf.set_parsed_buffers(normals, tangents, positions, texcoords, None, None, None, None, indices)
-        gltf.save(name, save_folder)
+    def add_to_gltf(self, gltf, name, lods=None, include_phy=False, quantize=False):
+        material_ids = gltf.add_materials([m.import_name for m in self.materials])
+        for i in self.get_LOD_ids(lods):
+            section_material_ids, uv_num = self.LODs[i].get_meta_for_gltf()
+            section_material_ids = [material_ids[j] for j in section_material_ids]
+            gltf_mesh = gltf.add_mesh(self.get_LOD_name(name, i, lods), section_material_ids, uv_num)
+            gltf_mesh.set_buffer_parsers(self.get_vertex_parser(i, quantize), self.LODs[i].parse_indices_for_gltf,
+                                        self.LODs[i].get_vertex_nums())
+
+    def LOD_to_psk(self, i):
+        return PSK([m.import_name for m in self.materials], *self.LODs[i].parse_for_psk())
+
+    def LOD_from_gltf(self, i, primitives, material_ids, joint_names):
+        return self.LODs[i].from_gltf(primitives, material_ids)
 
 #skeletal mesh
 class SkeletalMesh(Mesh):
+    PSK_EXT = '.psk'
+
     #unk: ?
     #materials: material names
     #skeleton: skeleton data
@@ -154,7 +235,9 @@ class SkeletalMesh(Mesh):
         LOD_num=read_uint32(f)
         LODs=[]
         for i in range(LOD_num):
-            lod=SkeletalLOD.read(f, ff7r=ff7r)
+            read_func=lambda f: SkeletalLOD.read(f, ff7r)
+            skim_func=lambda f: SkeletalLOD.skim(f, ff7r=ff7r)
+            lod=LazyLOD(f, read_func, SkeletalLOD.write, skim_func)
             lod.print(str(i), skeleton.bones)
             LODs.append(lod)
 
@@ -171,7 +254,7 @@ class SkeletalMesh(Mesh):
         f.write(skeletalmesh.unk)
         write_array(f, skeletalmesh.materials, SkeletalMaterial.write, with_length=True)
         Skeleton.write(f, skeletalmesh.skeleton)
-        write_array(f, skeletalmesh.LODs, SkeletalLOD.write, with_length=True)
+        write_array(f, skeletalmesh.LODs, LazyLOD.write, with_length=True)
         write_array(f, skeletalmesh.phy_mesh, PhysicalMesh.write, with_length=True)
 
     def import_LODs(self, skeletalmesh, only_mesh=False, only_phy_bones=False,
@@ -203,21 +286,49 @@ class SkeletalMesh(Mesh):
 
         logger.log("KDI buffers have been removed.")
 
-    def save_as_gltf(self, name, save_folder):
-        bones = self.skeleton.to_gltf_bones()
-        material_names = [m.import_name for m in self.materials]
-        material_ids, uv_num = self.LODs[0].get_meta_for_gltf()
-        gltf = glTF(bones, material_names, material_ids, uv_num)
-        normals, tangents, positions, texcoords, joints, weights, joints2, weights2, indices = self.LODs[0].parse_buffers_for_gltf()
-        gltf.set_parsed_buffers(normals, tangents, positions, texcoords, joints, weights, joints2, weights2, indices)
-        gltf.save(name, save_folder)
-        
+    #include_phy: export physical meshes as well (experimental)
+    def add_to_gltf(self, gltf, name, lods=None, include_phy=False, quantize=False):
+        #meshes with the same skeleton share a skin
+        key = self.skeleton.get_hash()
+        skin = gltf.get_skin_id(key)
+        if skin is None:
+            skin = gltf.add_skin(SkinCache.get(key, self.skeleton.to_gltf_bones), key=key)
+        material_ids = gltf.add_materials([m.import_name for m in self.materials])
+        for i in self.get_LOD_ids(lods):
+            section_material_ids, uv_num = self.LODs[i].get_meta_for_gltf()
+            section_material_ids = [material_ids[j] for j in section_material_ids]
+            gltf_mesh = gltf.add_mesh(self.get_LOD_name(name, i, lods), section_material_ids, uv_num, skin=skin)
+            gltf_mesh.set_buffer_parsers(self.get_vertex_parser(i, quantize), self.LODs[i].parse_indices_for_gltf,
+                                        self.LODs[i].get_vertex_nums())
+        if include_phy:
+            for mesh, i in zip(self.phy_mesh, range(len(self.phy_mesh))):
+                if not mesh.can_bind_to_bones(len(self.skeleton.bones)):
+                    logger.log('Skipped {}_phy{}. Its weight buffer can not be read as bone ids.'.format(name, i), ignore_verbose=True)
+                    continue
+                gltf_mesh = gltf.add_mesh(name+'_phy{}'.format(i), [None], 0, skin=skin)
+                gltf_mesh.set_buffer_parsers(mesh.parse_vertices_for_gltf, mesh.parse_indices_for_gltf, [len(mesh.vb)//12])
+
+    def LOD_to_psk(self, i):
+        lod = self.LODs[i]
+        psk = PSK([m.import_name for m in self.materials], *lod.parse_for_psk())
+        bones = self.skeleton.bones
+        psk.set_skeleton([b.name for b in bones], [b.parent for b in bones], self.skeleton.get_poses(), *lod.parse_weights_for_psk())
+        return psk
+
+    def LOD_from_gltf(self, i, primitives, material_ids, joint_names):
+        return self.LODs[i].from_gltf(primitives, material_ids, joint_names, self.skeleton.bones)
+
 #collider or something? low poly mesh.
 class PhysicalMesh:
     #vertices
-    #bone_id: vertex group? each vertex has a bone id.
+    #weight_buffer: 12 bytes for each vertex. (see WEIGHT_DTYPE)
     #faces
 
+    #records of weight_buffer are not fully known.
+    #bone_id: the first value looks like a bone id. (it's a guess. each vertex has a bone.)
+    #unk: the others are 0 in all known assets.
+    WEIGHT_DTYPE = np.dtype([('bone_id', '<u4'), ('unk', '<u4', 2)])
+
     def __init__(self, f):
         self.offset=f.tell()
         vertex_num=read_uint32(f)
@@ -242,6 +353,39 @@ class PhysicalMesh:
         write_uint32(f, len(mesh.ib)//6)
         f.write(mesh.ib)
 
+    def parse_weights(self):
+        return np.frombuffer(self.weight_buffer, dtype=PhysicalMesh.WEIGHT_DTYPE)
+
+    def get_bone_ids(self):
+        return self.parse_weights()['bone_id']
+
+    #vertices are bound to bones only when the records match the guess of WEIGHT_DTYPE.
+    #(bone ids are in the skeleton, and unknown values are 0)
+    def can_bind_to_bones(self, bone_num):
+        weights = self.parse_weights()
+        if (weights['bone_id']>=bone_num).any():
+            logger.log('Warning: Bone ids of a physical mesh are out of range. (bone num: {})'.format(bone_num), ignore_verbose=True)
+            return False
+        if weights['unk'].any():
+            logger.log('Warning: Unknown values detected in the weight buffer of a physical mesh.', ignore_verbose=True)
+            return False
+        return True
+
+    #parse vertices with the same conversion as LODs
+    #each vertex is influenced by one bone.
+    #first, last: sub-range of vertices (to parse large meshes in chunks)
+    def parse_vertices_for_gltf(self, i=0, first=0, last=None):
+        position = np.frombuffer(self.vb, dtype='<f4').reshape(-1, 3)[first:last, [0, 2, 1]]/100
+        bone_ids = self.get_bone_ids()[first:last]
+        joint = np.zeros((len(position), 4), dtype=np.uint16)
+        joint[:, 0] = bone_ids
+        weight = np.zeros((len(position), 4), dtype=np.uint8)
+        weight[:, 0] = 255
+        return None, None, position, [], None, joint, weight, None, None
+
+    def parse_indices_for_gltf(self, i=0):
+        return np.frombuffer(self.ib, dtype='<u2')
+
     def print(self, padding=0):
         pad=' '*padding
         logger.log(pad+'Mesh (offset: {})'.format(self.offset))
@@ -1,7 +1,8 @@
 from util.io_util import *
 from util.logger import logger
 from gltf.bone import Bone as gltfBone
-import struct
+import struct, hashlib
+import numpy as np
 
 class Bone:
     #name_id: id of name list
@@ -73,11 +74,13 @@ class Bone:
 
     def record_children(bones):
         children=[[] for i in range(len(bones))]
-        bone_names = [b.name for b in bones]
+        bone_ids = {}
+        for b, i in zip(bones, range(len(bones))):
+            bone_ids.setdefault(b.name, i)
         for b in bones:
             if b.parent_name=='None':
                 continue
-            children[bone_names.index(b.parent_name)].append(bone_names.index(b.name))
+            children[bone_ids[b.parent_name]].append(bone_ids[b.name])
         for b, c in zip(bones, children):
             b.children=c
 
@@ -137,6 +140,19 @@ class Skeleton:
         logger.log(pad+'  bone_num: {}'.format(len(self.bones)))
         Bone.print_bones(self.bones, padding=2+padding)
 
+    #content hash of bones (names, parents, and poses)
+    def get_hash(self):
+        sha = hashlib.sha1()
+        for b in self.bones:
+            sha.update(b.name.encode()+b'\x00')
+            sha.update(struct.pack('<i', b.parent))
+            sha.update(b.pos)
+        return sha.hexdigest()
+
+    #rotations, translations, and scales of bones (bone_num, 10)
+    def get_poses(self):
+        return np.frombuffer(b''.join([b.pos for b in self.bones]), dtype='<f4').reshape(-1, 10)
+
     def to_gltf_bones(self):
         Bone.record_children(self.bones)
         gltf_bones = [b.to_gltf_bone() for b in self.bones]
@@ -1,5 +1,6 @@
 from util.io_util import *
 from util.logger import logger
+from util.record import Record
 '''
 FILE HEADER
   byte {4}       - Unreal Header (193,131,42,158)
@@ -35,75 +36,46 @@ FILE HEADER
 
 class UassetHeader:
     HEAD = b'\xC1\x83\x2A\x9E'
+    RECORD = Record([
+        (None, '4s', HEAD, 'NOT a uasset file.'),
+        ('version', 'i'),
+        (None, '16s', b'\x00'*16, 'Parse Failed.'),
+        ('file_size', 'I'),
+        (None, '9s', b'\x05\x00\x00\x00None\x00', 'Parse Failed.'),
+        ('unk_ary', '4B'),
+        ('name_num', 'I'),
+        ('name_offset', 'I'),
+        (None, '8s', b'\x00'*8, 'Parse Failed.'),
+        ('export_num', 'I'),
+        ('export_offset', 'I'),
+        ('import_num', 'I'),
+        ('import_offset', 'I'),
+        ('unk1', '4s'),
+        (None, '16s', b'\x00'*16, 'Parse Failed.'),
+        ('guid_hash', '16s'),
+        ('unk2', '8s'),
+        ('name_num', 'I'),
+        (None, '36s', b'\x00'*36, 'Parse Failed.'),
+        ('unk3', '4s'),
+        (None, 'I', 0, 'Parse Failed.'),
+        ('padding_offset', 'I'),
+        ('file_length', 'I'),
+        (None, '12s', b'\x00'*12, 'Parse Failed.'),
+        ('unk4', '4s'),
+        ('file_data_offset', 'I')
+    ])
 
     def __init__(self, f):
-        head=f.read(4)
-        check(head, UassetHeader.HEAD, f, 'NOT a uasset file.')
-        self.version=-read_int32(f)-1
+        UassetHeader.RECORD.read(f, self)
+        self.version=-self.version-1
         check(self.version, 6, f, 'Unsupported version. (version {})'.format(self.version))
-        read_null_array(f, 4, 'Parse Failed.')
-        self.file_size=read_uint32(f)
-        none=read_str(f)
-        check(none, 'None', f, 'Parse Failed.')
-        self.unk_ary=read_uint8_array(f, len=4)
-
-        self.name_num = read_uint32(f)
-        self.name_offset = read_uint32(f)
         check(self.name_offset, 193, f, 'Parse Failed.')
-        read_null_array(f, 2, 'Parse Failed.')
-
-        self.export_num = read_uint32(f)
-        self.export_offset = read_uint32(f)
-        self.import_num = read_uint32(f)
-        self.import_offset = read_uint32(f)
-        self.unk1=f.read(4)
-        read_null_array(f, 4, 'Parse Failed.')
-
-        self.guid_hash=f.read(16)
-
-        self.unk2=f.read(8)
-
-        name_num=read_uint32(f)
-        check(name_num, self.name_num, f, 'Parse Failed.')
-        read_null_array(f, 9, 'Parse Failed.')
-        self.unk3=f.read(4)
-        read_null(f, 'Parse Failed.')
-        self.padding_offset = read_uint32(f)
-        self.file_length=read_uint32(f)
-        read_null_array(f, 3, 'Parse Failed.')
-        self.unk4=f.read(4)
-        self.file_data_offset = read_uint32(f)
 
     def read(f):
         return UassetHeader(f)
     
     def write(f, header):
-        f.write(UassetHeader.HEAD)
-        write_int32(f, -(header.version+1))
-        write_null_array(f, 4)
-        write_uint32(f, header.file_size)
-        write_str(f, 'None')
-        write_uint8_array(f, header.unk_ary)
-        write_uint32(f, header.name_num)
-        write_uint32(f, header.name_offset)
-        write_null_array(f, 2)
-        write_uint32(f, header.export_num)
-        write_uint32(f, header.export_offset)
-        write_uint32(f, header.import_num)
-        write_uint32(f, header.import_offset)
-        f.write(header.unk1)
-        write_null_array(f, 4)
-        f.write(header.guid_hash)
-        f.write(header.unk2)
-        write_uint32(f, header.name_num)
-        write_null_array(f, 9)
-        f.write(header.unk3)
-        write_null(f)
-        write_uint32(f, header.padding_offset)
-        write_uint32(f, header.file_length)
-        write_null_array(f, 3)
-        f.write(header.unk4)
-        write_uint32(f, header.file_data_offset)
+        UassetHeader.RECORD.write(f, header, version=-(header.version+1))
 
     def print(self):
         logger.log('Header info')
@@ -121,23 +93,23 @@ class UassetHeader:
         logger.log('  file data offset: {}'.format(self.file_data_offset))
 
 class UassetImport: #28 bytes
+    RECORD = Record([
+        ('bin1', '8s'),
+        ('class_id', 'I'),
+        ('bin2', '8s'),
+        ('name_id', 'I'),
+        ('bin3', '4s')
+    ])
+
     def __init__(self, f):
-        self.bin1=f.read(8)
-        self.class_id=read_uint32(f)
-        self.bin2=f.read(8)
-        self.name_id=read_uint32(f)
-        self.bin3=f.read(4)
+        UassetImport.RECORD.read(f, self)
         self.material=False
 
     def read(f):
         return UassetImport(f)
     
     def write(f, import_):
-        f.write(import_.bin1)
-        write_uint32(f, import_.class_id)
-        f.write(import_.bin2)
-        write_uint32(f, import_.name_id)
-        f.write(import_.bin3)
+        UassetImport.RECORD.write(f, import_)
 
     def name_imports(imports, name_list):
         skeletal=False
@@ -172,28 +144,26 @@ class UassetExport: #104 bytes
         'SkeletalMeshSocket']
     IGNORE=[True, True, True, True, True, True, True, True, True]
     #'BodySetup'
+    RECORD = Record([
+        ('import_id', 'i'),
+        ('bin1', '12s'),
+        ('name_id', 'I'),
+        ('bin2', '8s'),
+        ('size', 'I'),
+        (None, 'I', 0, 'Not NULL!'),
+        ('offset', 'I'),
+        ('bin3', '64s')
+    ])
+
     def __init__(self, f):
-        self.import_id = -read_int32(f)-1
-        self.bin1=f.read(12)
-        self.name_id=read_uint32(f)
-        self.bin2=f.read(8)
-        self.size=read_uint32(f)
-        read_null(f)
-        self.offset=read_uint32(f)
-        self.bin3=f.read(64)
+        UassetExport.RECORD.read(f, self)
+        self.import_id = -self.import_id-1
 
     def read(f):
         return UassetExport(f)
     
     def write(f, export):
-        write_int32(f, -export.import_id-1)
-        f.write(export.bin1)
-        write_uint32(f, export.name_id)
-        f.write(export.bin2)
-        write_uint32(f, export.size)
-        write_null(f)
-        write_uint32(f, export.offset)
-        f.write(export.bin3)
+        UassetExport.RECORD.write(f, export, import_id=-export.import_id-1)
 
     def update(self, size, offset):
         self.size=size
@@ -249,19 +219,21 @@ class Uasset:
         
         logger.log('Name list')
         
+        #read tables from byte slices
+        buf=MemoryReader(f.read(self.header.import_offset-f.tell()))
         self.name_list = []
         self.flag_list = []
         for i in range(self.header.name_num):
-            name = read_str(f)
-            flag = f.read(4)
+            name = read_str(buf)
+            flag = bytes(buf.read(4))
 
             logger.log('  {}: {}'.format(i, name))
             self.name_list.append(name)
             self.flag_list.append(flag)
-        offset=f.tell()
-        self.bin2=f.read(self.header.import_offset-offset)
+        self.bin2=bytes(buf.read())
 
-        self.imports=read_array(f, UassetImport.read, len=self.header.import_num)
+        buf=MemoryReader(f.read(UassetImport.RECORD.size*self.header.import_num))
+        self.imports=read_array(buf, UassetImport.read, len=self.header.import_num)
         self.ff7r = UassetImport.name_imports(self.imports, self.name_list)
         logger.log('Import')
         for import_ in self.imports:
@@ -269,7 +241,8 @@ class Uasset:
 
         offset=f.tell()
         self.bin3=f.read(self.header.export_offset-offset)
-        self.exports=read_array(f, UassetExport.read, len=self.header.export_num)
+        buf=MemoryReader(f.read(UassetExport.RECORD.size*self.header.export_num))
+        self.exports=read_array(buf, UassetExport.read, len=self.header.export_num)
         self.asset_type = UassetExport.name_exports(self.exports, self.imports, self.name_list, self.file)
 
         logger.log('Export')
@@ -8,14 +8,37 @@ from util.cipher import Cipher
 from asset.mesh import StaticMesh, SkeletalMesh
 from asset.skeleton import SkeletonAsset
 from asset.uasset import Uasset
+from gltf.reader import glTFReader
 
 class MeshUexp:
 
     UNREAL_SIGNATURE=b'\xC1\x83\x2A\x9E'
     
     def __init__(self, file):
+        self.reader = None
         self.load(file)
 
+    #release the memory map of .uexp. the asset can not be used after closing.
+    def close(self):
+        if self.reader is None:
+            return
+        self.mesh = None
+        self.skeleton = None
+        self.unknown2 = None
+        self.meta = None
+        self.foot = None
+        for export in self.exports:
+            if export.ignore:
+                export.bin = None
+        self.reader.close()
+        self.reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def load(self, file):
         if file[-4:]!='uexp':
             raise RuntimeError('Not .uexp! ({})'.format(file))
@@ -46,37 +69,39 @@ class MeshUexp:
 
         logger.log('Loading '+file+'...', ignore_verbose=True)
         #open .uexp
-        with open(file, 'rb') as f:
-
-            for export in self.exports:
-                if f.tell()+self.uasset.size!=export.offset:
-                    raise RuntimeError('Parse failed.')
-                if export.ignore:
-                    logger.log('{} (offset: {})'.format(export.name, f.tell()))
-                    logger.log('  size: {}'.format(export.size))
-                    export.read_uexp(f)
+        #buffers are memoryviews of the mapped file until they are modified.
+        f = MemoryReader.open(file)
+        self.reader = f
+
+        for export in self.exports:
+            if f.tell()+self.uasset.size!=export.offset:
+                raise RuntimeError('Parse failed.')
+            if export.ignore:
+                logger.log('{} (offset: {})'.format(export.name, f.tell()))
+                logger.log('  size: {}'.format(export.size))
+                export.read_uexp(f)
                     
-                else:
-                    if export.id==-1:
-                        #'SkeletalMesh', 'StaticMesh', 'Skeleton'
-                        if self.asset_type=='SkeletalMesh':
-                            self.mesh=SkeletalMesh.read(f, self.ff7r, self.name_list, self.imports)
-                        elif self.asset_type=='StaticMesh':
-                            self.mesh=StaticMesh.read(f, self.ff7r, self.name_list, self.imports)
-                        elif self.asset_type=='Skeleton':
-                            self.skeleton = SkeletonAsset.read(f, self.name_list)
-                        self.unknown2=f.read(export.offset+export.size-f.tell()-self.uasset.size)
-
-            #footer
-            offset = f.tell()
-            size = get_size(f)
-            self.meta=f.read(size-offset-4)
-            self.author = Cipher.decrypt(self.meta)                
-
-            if self.author!='':
-                print('Author: {}'.format(self.author))
-            self.foot=f.read()
-            check(self.foot, MeshUexp.UNREAL_SIGNATURE, f, 'Parse failed. (foot)')
+            else:
+                if export.id==-1:
+                    #'SkeletalMesh', 'StaticMesh', 'Skeleton'
+                    if self.asset_type=='SkeletalMesh':
+                        self.mesh=SkeletalMesh.read(f, self.ff7r, self.name_list, self.imports)
+                    elif self.asset_type=='StaticMesh':
+                        self.mesh=StaticMesh.read(f, self.ff7r, self.name_list, self.imports)
+                    elif self.asset_type=='Skeleton':
+                        self.skeleton = SkeletonAsset.read(f, self.name_list)
+                    self.unknown2=f.read(export.offset+export.size-f.tell()-self.uasset.size)
+
+        #footer
+        offset = f.tell()
+        size = get_size(f)
+        self.meta=f.read(size-offset-4)
+        self.author = Cipher.decrypt(self.meta)                
+
+        if self.author!='':
+            print('Author: {}'.format(self.author))
+        self.foot=f.read()
+        check(self.foot, MeshUexp.UNREAL_SIGNATURE, f, 'Parse failed. (foot)')
 
     def save(self, file):
         logger.log('Saving '+file+'...', ignore_verbose=True)
@@ -104,17 +129,35 @@ class MeshUexp:
             uexp_size=f.tell()
         self.uasset.save(file[:-4]+'uasset', uexp_size)
 
-    def save_as_gltf(self, save_folder):
+    def save_as_gltf(self, save_folder, file_format='gltf', lods=None, jobs=1, include_phy=False, quantize=False, meshopt=False):
         if self.asset_type=='Skeleton':
             raise RuntimeError('Unsupported feature for static mesh')
-        self.mesh.save_as_gltf(self.name, save_folder)
+        self.mesh.save_as_gltf(self.name, save_folder, file_format=file_format, lods=lods, jobs=jobs,
+                              include_phy=include_phy, quantize=quantize, meshopt=meshopt)
+
+    def save_as_psk(self, save_folder, lods=None):
+        if self.asset_type=='Skeleton':
+            raise RuntimeError('Unsupported feature for skeleton')
+        self.mesh.save_as_psk(self.name, save_folder, lods=lods)
+
+    def add_to_gltf(self, gltf, lods=None, include_phy=False, quantize=False):
+        if self.asset_type=='Skeleton':
+            raise RuntimeError('Unsupported feature for skeleton')
+        self.mesh.add_to_gltf(gltf, self.name, lods=lods, include_phy=include_phy, quantize=quantize)
 
 
     def remove_LODs(self):
         self.mesh.remove_LODs()
 
+    def parse_LODs(self):
+        if self.asset_type!='Skeleton':
+            self.mesh.parse_LODs()
+
     def import_LODs(self, mesh_uexp, only_mesh=False, only_phy_bones=False,
                     dont_remove_KDI=False, ignore_material_names=False):
+        if isinstance(mesh_uexp, glTFReader):
+            self.import_gltf(mesh_uexp, dont_remove_KDI=dont_remove_KDI, ignore_material_names=ignore_material_names)
+            return
         if self.asset_type!=mesh_uexp.asset_type and self.asset_type!='Skeleton':
             raise RuntimeError('Asset types are not the same. ({}, {})'.format(self.asset_type, mesh_uexp.asset_type))
         if self.asset_type=='SkeletalMesh':
@@ -128,6 +171,20 @@ class MeshUexp:
                 raise RuntimeError('ue4_18_file should be skeletal mesh.')
             self.skeleton.import_bones(mesh_uexp.mesh.skeleton.bones, only_phy_bones=only_phy_bones)
 
+    #import LODs from glTF without UE4.18
+    #bones can not be imported. the skeleton of this asset will be used.
+    def import_gltf(self, reader, dont_remove_KDI=False, ignore_material_names=False):
+        if self.asset_type=='SkeletalMesh':
+            if dont_remove_KDI:
+                raise RuntimeError('"--dont_remove_KDI" can not be used with glTF. KDI buffers are for the original vertices.')
+            logger.log('Bones are not imported from glTF. The original skeleton will be used.', ignore_verbose=True)
+            self.mesh.import_LODs(self.mesh.load_gltf(reader), only_mesh=True, dont_remove_KDI=dont_remove_KDI,
+                                  ignore_material_names=ignore_material_names)
+        elif self.asset_type=='StaticMesh':
+            self.mesh.import_LODs(self.mesh.load_gltf(reader), ignore_material_names=ignore_material_names)
+        else:
+            raise RuntimeError('Unsupported feature for skeleton')
+
     def remove_KDI(self):
         if self.asset_type=='SkeletalMesh':
             self.mesh.remove_KDI()
@@ -1,4 +1,5 @@
-from gltf.mat import Mat4
+import numpy as np
+from gltf import mat
 
 class Bone:
     def __init__(self, name, children, rot, trans, scale):
@@ -6,38 +7,44 @@ class Bone:
         self.children = children
         self.trans=trans
         self.rot = [-rot[0], -rot[1], -rot[2], rot[3]]
-        rot_mat = Mat4.quaternion_to_matrix(self.rot)
-        trans_mat = Mat4.transform_to_matrix([-x for x in trans])
-        scale_mat = Mat4.scale_to_matrix(scale)
-        self.local_matrix = trans_mat*rot_mat*scale_mat
-        self.global_matrix = None
+        self.scale=scale
 
-    def to_node(self):
+    #offset: node id of the first bone
+    def to_node(self, offset=1):
         node = {'name': self.name}
         if self.children!=[]:      
-            node['children']=self.children
+            node['children']=[c-1+offset for c in self.children]
         node['translation']=self.trans
         node['rotation']=self.rot
         return node
 
-    def bones_to_nodes(bones):
-        base_node = {'name': '', 'mesh': 0, 'skin': 0, 'children': [1]}
-        nodes = [base_node]+[b.to_node() for b in bones]
-        return nodes
+    def bones_to_nodes(bones, offset=1):
+        return [b.to_node(offset=offset) for b in bones]
 
-    def update_global_matrix_rec(self, matrix, bones):
-        self.global_matrix=matrix*self.local_matrix
-        #self.matrix_bin = (self.global_matrix*Mat4.quaternion_to_matrix([0, -0.7071, 0, 0.7071])).to_bin()
-        self.matrix_bin = self.global_matrix.to_bin()
-        for c in self.children:
-            bones[c-1].update_global_matrix_rec(self.global_matrix, bones)
+    def get_parent_ids(bones):
+        parent_ids = np.full(len(bones), -1)
+        for b, i in zip(bones, range(len(bones))):
+            for c in b.children:
+                parent_ids[c-1]=i
+        return parent_ids
 
-    def update_global_matrix(bones):
-        for b in bones:
-            b.global_matrix = None
+    def get_local_matrices(bones):
+        rot_mat = mat.quaternion_to_matrix([b.rot for b in bones])
+        trans_mat = mat.translation_to_matrix([[-x for x in b.trans] for b in bones])
+        scale_mat = mat.scale_to_matrix([b.scale for b in bones])
+        return trans_mat @ rot_mat @ scale_mat
 
-        for b in bones:
-            if b.global_matrix is None:
-                b.update_global_matrix_rec(Mat4.identity(), bones)
-        
-    
\ No newline at end of file
+    #global matrices are computed from roots to leaves. (one matmul for each depth)
+    def get_global_matrices(bones):
+        local_matrices = Bone.get_local_matrices(bones)
+        global_matrices = local_matrices.copy()
+        parent_ids = Bone.get_parent_ids(bones)
+        ids = np.flatnonzero(parent_ids<0)
+        while len(ids)>0:
+            ids = np.flatnonzero(np.isin(parent_ids, ids))
+            global_matrices[ids] = global_matrices[parent_ids[ids]] @ local_matrices[ids]
+        return global_matrices
+
+    #inverse bind matrices as one buffer
+    def get_matrix_bin(bones):
+        return np.ascontiguousarray(Bone.get_global_matrices(bones), dtype='<f4')
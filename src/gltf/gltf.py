@@ -1,13 +1,15 @@
-import os, json, sys, struct
-from gltf.bone import Bone
+import os, json, time, struct, shutil, tempfile, functools, collections
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from util.logger import logger
+from gltf.meshopt import VertexEncoder, IndexEncoder
 
 #componentType
 #5120: signed byte
 #5121: unsighed byte (color, weight)
 #5122: sighned short
 #5123: unsigned short (id, joint)
-#5125: unsigned int
+#5125: unsigned int (id)
 #5126: float (pos, normal, tangent, texcoord)
 
 #type
@@ -67,68 +69,260 @@ class Material:
         }
         return d
 
-class glTF:
-    def __init__(self, bones, material_names, material_ids, uv_num):
-        self.bones = bones
-        self.materials = [Material(name) for name in material_names]
+#Mesh data for each LOD
+#Vertex attributes of a LOD are stored in an interleaved buffer view.
+#Each section refers to its range of the buffer view with byteOffset.
+class Mesh:
+    def __init__(self, name, material_ids, uv_num, skin):
+        self.name = name
         self.material_ids = material_ids
         self.uv_num = uv_num
+        self.skin = skin
 
-    def set_parsed_buffers(self, normals, tangents, positions, texcoords, joints, weights, joints2, weights2, indices):
-        self.normals = normals
-        self.tangents = tangents
-        self.positions = positions
-        self.texcoords = texcoords
-        self.joints = joints
-        self.weights = weights
-        self.joints2 = joints2
-        self.weights2 = weights2
-        self.texcoords = texcoords
-        self.indices = indices
+    #parse_vertices: function to parse vertex buffers of a section
+    #parse_indices: function to parse rebased indices of a section
+    #section_vertex_nums: the number of vertices in each section
+    def set_buffer_parsers(self, parse_vertices, parse_indices, section_vertex_nums):
+        self.parse_vertices = parse_vertices
+        self.parse_indices = parse_indices
+        self.section_vertex_nums = section_vertex_nums
+        self.quantized = False
+        section_num = len(self.material_ids)
+        self.index_types = [None]*section_num
+        self.index_nums = [None]*section_num
+        self.vertex_nums = [None]*section_num
+        self.position_ranges = [None]*section_num
 
-    def get_meshes(self):
-        i=int(self.bones is not None)
+    #(attribute name, data, dtype, number of components, componentType, type, normalized)
+    #attributes without data will be skipped.
+    def get_attributes(self, normal, tangent, position, texcoords, color, joint, weight, joint2, weight2):
+        attributes = [
+            ('POSITION', position, '<f4', 3, 5126, 'VEC3', None),
+            Mesh.get_quantizable_attribute('NORMAL', normal, 3, 'VEC3'),
+            Mesh.get_quantizable_attribute('TANGENT', tangent, 4, 'VEC4')
+        ]
+        if self.skin is not None:
+            attributes += [
+                ('JOINTS_0', joint, '<u2', 4, 5123, 'VEC4', None),
+                ('WEIGHTS_0', weight, 'u1', 4, 5121, 'VEC4', True),
+                ('JOINTS_1', joint2, '<u2', 4, 5123, 'VEC4', None),
+                ('WEIGHTS_1', weight2, 'u1', 4, 5121, 'VEC4', True)
+            ]
+        for texcoord, j in zip(texcoords, range(self.uv_num)):
+            attributes.append(Mesh.get_quantizable_attribute('TEXCOORD_{}'.format(j), texcoord, 2, 'VEC2'))
+        attributes.append(('COLOR_0', color, 'u1', 4, 5121, 'VEC4', True))
+        return [a for a in attributes if a[1] is not None]
+
+    #float32, or normalized integers for KHR_mesh_quantization
+    QUANTIZED_TYPES = {'int8': ('i1', 5120), 'uint16': ('<u2', 5123)}
+    def get_quantizable_attribute(name, data, num, type):
+        if data is not None and data.dtype.name in Mesh.QUANTIZED_TYPES:
+            dtype, component_type = Mesh.QUANTIZED_TYPES[data.dtype.name]
+            return (name, data, dtype, num, component_type, type, True)
+        return (name, data, '<f4', num, 5126, type, None)
+
+    #attributes are aligned to 4 bytes in vertex buffers
+    def get_padded_num(dtype, num):
+        size = np.dtype(dtype).itemsize
+        return num + (-size*num)%4//size
+
+    #uint16 or uint32 (65535 and 4294967295 can not be used as indices in glTF)
+    def get_index_type(ids):
+        if len(ids)>0 and np.max(ids)>=0xFFFF:
+            return '<u4', 5125
+        return '<u2', 5123
+
+    #get tasks to make binary data in the order of buffer views. (a buffer view is a list of tasks.)
+    #indices of each section, then vertices of all sections.
+    #each task is (function to make data of a section, function to record its meta data for to_dict).
+    #the first functions can run on worker threads. the others run in order on the main thread.
+    #vertices are made in chunks to keep memory usage low for large sections.
+    VERTEX_CHUNK_SIZE = 0x10000
+    def get_buffer_data(self):
+        self.set_vertex_layout()
+        section_num = len(self.material_ids)
+        self.vertex_nums = [0]*section_num
+        self.position_ranges = [None]*section_num
+        for i in range(section_num):
+            yield [(functools.partial(self.get_index_buffer, i), functools.partial(self.record_index_buffer, i))]
+        tasks = []
+        for vertex_num, i in zip(self.section_vertex_nums, range(section_num)):
+            #sections without vertices still have a task to record their meta data
+            for first in range(0, max(vertex_num, 1), Mesh.VERTEX_CHUNK_SIZE):
+                tasks.append((functools.partial(self.get_vertex_buffer, i, first, first+Mesh.VERTEX_CHUNK_SIZE),
+                              functools.partial(self.record_vertex_buffer, i)))
+        yield tasks
+
+    #attributes are the same for all sections of a LOD.
+    #get them from an empty section before making buffers.
+    def set_vertex_layout(self):
+        attributes = self.get_attributes(*self.parse_vertices(0, first=0, last=0))
+        self.vertex_dtype = np.dtype([(name, dtype, Mesh.get_padded_num(dtype, num)) for name, _, dtype, num, _, _, _ in attributes])
+        self.accessor_types = [(name, component_type, type, normalized) for name, _, _, _, component_type, type, normalized in attributes]
+        self.quantized = any([component_type!=5126 for name, _, _, _, component_type, _, _ in attributes
+                              if name in ['NORMAL', 'TANGENT'] or name.startswith('TEXCOORD')])
+
+    def get_index_buffer(self, i):
+        ids = self.parse_indices(i)
+        dtype, component_type = Mesh.get_index_type(ids)
+        return np.asarray(ids, dtype=dtype), component_type
+
+    def record_index_buffer(self, i, result):
+        ids, component_type = result
+        self.index_types[i] = component_type
+        self.index_nums[i] = len(ids)
+        return ids
+
+    #interleaved vertex buffer for a chunk of a section
+    def get_vertex_buffer(self, i, first, last):
+        attributes = self.get_attributes(*self.parse_vertices(i, first=first, last=last))
+        position = attributes[0][1]
+        vertex_buffer = np.empty(len(position), dtype=self.vertex_dtype)
+        for name, data, dtype, num, _, _, _ in attributes:
+            if Mesh.get_padded_num(dtype, num)==num:
+                vertex_buffer[name] = data
+            else:
+                vertex_buffer[name][:, :num] = data
+                vertex_buffer[name][:, num:] = 0
+        return vertex_buffer, glTF.get_position_range(position)
+
+    def record_vertex_buffer(self, i, result):
+        vertex_buffer, (min_pos, max_pos) = result
+        self.vertex_nums[i] += len(vertex_buffer)
+        if self.position_ranges[i] is not None:
+            min_pos = np.minimum(self.position_ranges[i][0], min_pos).tolist()
+            max_pos = np.maximum(self.position_ranges[i][1], max_pos).tolist()
+        self.position_ranges[i] = min_pos, max_pos
+        return vertex_buffer
+
+    def get_view_num(self):
+        return len(self.material_ids)+1
+
+    #accessors: accessor list. new accessors will be added to it.
+    #view_id: the first buffer view id for the mesh
+    def to_dict(self, accessors, view_id):
+        vertex_view_id = view_id+len(self.index_nums)
+        stride = self.vertex_dtype.itemsize
+        first = 0
         primitives = []
-        for material_id in self.material_ids:
-            indices = i
-            attributes = {
-                'POSITION' : i+1,
-                'NORMAL' : i+2,
-                'TANGENT' : i+3,
-            }
-            i+=4
-            if self.bones is not None:
-                attributes['JOINTS_0'] = i
-                attributes['WEIGHTS_0'] = i+1
-                i+=2
-                if self.joints2 is not None:
-                    attributes['JOINTS_1'] = i
-                    attributes['WEIGHTS_1'] = i+1
-                    i+=2
-
-            for j in range(self.uv_num):
-                attributes['TEXCOORD_{}'.format(j)]=i+j
-            i+=j+1
+        for material_id, index_type, index_num, vert_num, (min_pos, max_pos), j in zip(self.material_ids, self.index_types, self.index_nums,
+                                                                                      self.vertex_nums, self.position_ranges, range(len(self.index_nums))):
             primitive = {
-                'attributes': attributes,
-                'indices': indices,
-                'material': material_id
+                'attributes': {},
+                'indices': len(accessors)
             }
+            if material_id is not None:
+                primitive['material'] = material_id
+            accessors.append(glTF.get_accessor(view_id+j, index_type, index_num, 'SCALAR'))
+            for name, component_type, type, normalized in self.accessor_types:
+                offset = first*stride+self.vertex_dtype.fields[name][1]
+                primitive['attributes'][name] = len(accessors)
+                if name=='POSITION':
+                    accessor = glTF.get_accessor(vertex_view_id, component_type, vert_num, type, offset=offset,
+                                                 min_pos=min_pos, max_pos=max_pos)
+                else:
+                    accessor = glTF.get_accessor(vertex_view_id, component_type, vert_num, type, offset=offset,
+                                                 normalized=normalized)
+                accessors.append(accessor)
+            first += vert_num
             primitives.append(primitive)
 
-        meshes = [{
+        mesh = {
             'primitives': primitives,
-            'name': ''
-        }]
-        return meshes
+            'name': self.name
+        }
+        return mesh
+
+class glTF:
+    def __init__(self):
+        self.skins = []
+        self.skin_keys = []
+        self.materials = []
+        self.meshes = []
 
-    def get_accessor(i, component_type, count, type, min_pos=None, max_pos=None, normalized=None):
+    #key: content hash to share a skin between meshes
+    def get_skin_id(self, key):
+        if key is None or key not in self.skin_keys:
+            return None
+        return self.skin_keys.index(key)
+
+    #skin: gltf.skin.Skin
+    def add_skin(self, skin, key=None):
+        self.skins.append(skin)
+        self.skin_keys.append(key)
+        return len(self.skins)-1
+
+    #add materials and get their ids in glTF
+    #materials added by other meshes are shared if they have the same names.
+    def add_materials(self, material_names):
+        material_ids = {}
+        for m, i in zip(self.materials, range(len(self.materials))):
+            material_ids.setdefault(m.name, i)
+        new_ids = []
+        for name in material_names:
+            if name in material_ids:
+                new_ids.append(material_ids[name])
+            else:
+                new_ids.append(len(self.materials))
+                self.materials.append(Material(name))
+        return new_ids
+
+    #skin: skin id (None for static meshes)
+    def add_mesh(self, name, material_ids, uv_num, skin=None):
+        mesh = Mesh(name, material_ids, uv_num, skin)
+        self.meshes.append(mesh)
+        return mesh
+
+    #get meshes and accessors
+    def get_meshes(self):
+        accessors=[]
+        for skin, i in zip(self.skins, range(len(self.skins))):
+            accessors.append(glTF.get_accessor(i, 5126, skin.get_bone_num(), 'MAT4'))
+        view_id=len(self.skins)
+        meshes = []
+        for mesh in self.meshes:
+            meshes.append(mesh.to_dict(accessors, view_id))
+            view_id+=mesh.get_view_num()
+        return meshes, accessors
+
+    #the first mesh of each skin has the root bone as a child.
+    #other meshes are placed after bones.
+    def get_nodes(self):
+        nodes = []
+        scene_nodes = []
+        skins = []
+        first_mesh_ids = []
+        for skin, i in zip(self.skins, range(len(self.skins))):
+            mesh_id = [mesh.skin for mesh in self.meshes].index(i)
+            first_mesh_ids.append(mesh_id)
+            scene_nodes.append(len(nodes))
+            offset = len(nodes)+1
+            nodes.append({'name': self.meshes[mesh_id].name, 'mesh': mesh_id, 'skin': i, 'children': [offset]})
+            nodes += skin.get_nodes(offset=offset)
+            skins.append({
+                'inverseBindMatrices' : i,
+                'skeleton' : offset,
+                'joints' : [offset+j for j in range(skin.get_bone_num())]
+            })
+        for mesh, i in zip(self.meshes, range(len(self.meshes))):
+            if i in first_mesh_ids:
+                continue
+            node = {'name': mesh.name, 'mesh': i}
+            if mesh.skin is not None:
+                node['skin'] = mesh.skin
+            scene_nodes.append(len(nodes))
+            nodes.append(node)
+        return nodes, scene_nodes, skins
+
+    def get_accessor(i, component_type, count, type, offset=0, min_pos=None, max_pos=None, normalized=None):
         accessor = {
             'bufferView': i,
             'componentType': component_type,
             'count': count,
             'type': type
         }
+        if offset>0:
+            accessor['byteOffset']=offset
         if min_pos is not None:
             accessor['min']=list(min_pos)
             accessor['max']=list(max_pos)
@@ -136,112 +330,130 @@ class glTF:
             accessor['normalized']=normalized
         return accessor
 
+    #sections without vertices have zero bounds
     def get_position_range(position):
-        min_pos=[sys.float_info.max for i in range(3)]
-        max_pos=[sys.float_info.min for i in range(3)]
-        for pos in position:
-            min_pos = [min(a, b) for a, b in zip(min_pos, pos)]
-            max_pos = [max(a, b) for a, b in zip(max_pos, pos)]
-        return min_pos, max_pos
-
-    def get_accessors(self):
-        i=0
-        accessors=[]
-        if self.bones is not None:
-            accessors.append(glTF.get_accessor(i, 5126, len(self.bones), 'MAT4'))
-            i=1
-        for j in range(len(self.positions)):
-            vert_ids = self.indices[j]
-            accessors.append(glTF.get_accessor(i, 5123, len(vert_ids), 'SCALAR'))
-            position = self.positions[j]
-            vert_num = len(position)
-            min_pos, max_pos = glTF.get_position_range(position)
-            accessors.append(glTF.get_accessor(i+1, 5126, vert_num, 'VEC3', min_pos = min_pos, max_pos = max_pos))
-            accessors.append(glTF.get_accessor(i+2, 5126, vert_num, 'VEC3'))
-            accessors.append(glTF.get_accessor(i+3, 5126, vert_num, 'VEC4'))
-            i+=4
-            if self.bones is not None:
-                accessors.append(glTF.get_accessor(i, 5123, vert_num, 'VEC4'))
-                accessors.append(glTF.get_accessor(i+1, 5121, vert_num, 'VEC4', normalized=True))
-                i+=2
-                if self.joints2 is not None:
-                    accessors.append(glTF.get_accessor(i, 5123, vert_num, 'VEC4'))
-                    accessors.append(glTF.get_accessor(i+1, 5121, vert_num, 'VEC4', normalized=True))
-                    i+=2
-
-            for k in range(self.uv_num):
-                accessors.append(glTF.get_accessor(i+k, 5126, vert_num, 'VEC2'))
-            i+=k+1
-        
-        return accessors
+        position = np.asarray(position)
+        if len(position)==0:
+            return [0, 0, 0], [0, 0, 0]
+        return position.min(axis=0).tolist(), position.max(axis=0).tolist()
 
-    def view_to_dict(offset, size):
+    def view_to_dict(offset, size, stride=None, buffer=0):
         d={
-            'buffer': 0,
+            'buffer': buffer,
             'byteOffset': offset,
             'byteLength': size
         }
+        if stride is not None:
+            d['byteStride']=stride
         return d
 
-    def write_buffer(f, list, type, flatten=False):
-        if flatten:
-            list = [x for row in list for x in row]
-        offset = f.tell()
-        
-        try:
-            bin = struct.pack('<'+type*len(list), *list)
-        except:
-            mi = 2**30
-            ma = -2**30
-            for i in list:
-                mi = min(mi, i)
-                ma = max(ma, i)
-            print(mi, ma)
-
-            raise RuntimeError('Failed to export as gltf.')
-        f.write(bin)
-        size = f.tell()-offset
-        return glTF.view_to_dict(offset, size)
-
-    def write_buffers(self, name, save_folder):
-        file=os.path.join(save_folder, name+'.bin')
+    #get binary data in the order of buffer views
+    def get_buffer_data(self):
+        for skin in self.skins:
+            yield [(skin.get_matrix_bin, None)]
+        for mesh in self.meshes:
+            yield from mesh.get_buffer_data()
+
+    def get_data_size(data):
+        if isinstance(data, np.ndarray):
+            return data.nbytes
+        return len(data)
+
+    #run tasks on a thread pool and get the results in order
+    #the number of tasks in progress is limited to keep memory usage low.
+    def run_tasks(tasks, jobs=1):
+        if jobs<=1:
+            for task in tasks:
+                yield task()
+            return
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = collections.deque()
+            for task in tasks:
+                futures.append(executor.submit(task))
+                if len(futures)>=jobs*2:
+                    yield futures.popleft().result()
+            while len(futures)>0:
+                yield futures.popleft().result()
+
+    #write buffer views one by one, and get their offsets
+    #buffer views are aligned to 4 bytes
+    #meshopt: compress vertex and index buffers with EXT_meshopt_compression.
+    #         compressed data is written to buffer 0, and buffer 1 is a fallback buffer without data.
+    #stats: a list to get (raw size, written size, encode time) of each view
+    def write_buffer_data(f, data, jobs=1, meshopt=False, stats=None):
+        views = list(data)
+        results = glTF.run_tasks([task for view in views for task, _ in view], jobs=jobs)
         buffer_views = []
+        offset = 0
+        fallback_offset = 0
+        for view in views:
+            size = 0
+            written = 0
+            stride = None
+            encoder = None
+            encode_time = 0
+            for _, record in view:
+                d = next(results)
+                if record is not None:
+                    d = record(d)
+                size += glTF.get_data_size(d)
+                if isinstance(d, np.ndarray):
+                    #interleaved vertex buffer
+                    if d.dtype.names is not None:
+                        stride = d.dtype.itemsize
+                    if meshopt:
+                        start = time.perf_counter()
+                        if encoder is None:
+                            encoder = VertexEncoder(stride) if stride is not None else IndexEncoder(d.itemsize)
+                        d = encoder.encode(d)
+                        encode_time += time.perf_counter()-start
+                        written += len(d)
+                    else:
+                        d = np.ascontiguousarray(d).data
+                f.write(d)
+            if encoder is not None:
+                start = time.perf_counter()
+                d = encoder.finish()
+                encode_time += time.perf_counter()-start
+                f.write(d)
+                written += len(d)
+                view_dict = glTF.view_to_dict(fallback_offset, size, stride=stride, buffer=1)
+                view_dict['extensions'] = {
+                    'EXT_meshopt_compression': {
+                        'buffer': 0,
+                        'byteOffset': offset,
+                        'byteLength': written,
+                        'byteStride': encoder.get_stride(),
+                        'count': encoder.count,
+                        'mode': encoder.get_mode()
+                    }
+                }
+                buffer_views.append(view_dict)
+                fallback_offset += size + (-size)%4
+            else:
+                written = size
+                buffer_views.append(glTF.view_to_dict(offset, size, stride=stride))
+            if stats is not None:
+                stats.append((size, written, encode_time))
+            f.write(b'\x00'*((-written)%4))
+            offset += written + (-written)%4
+        buffer_sizes = [offset]
+        if fallback_offset>0:
+            buffer_sizes.append(fallback_offset)
+        return buffer_views, buffer_sizes
 
-        if self.bones is not None:
-            Bone.update_global_matrix(self.bones)
-        
-        with open(file, 'wb') as f:
-            
-            if self.bones is not None:
-                offset = f.tell()
-                for b in self.bones:
-                    f.write(b.matrix_bin)
-                size=f.tell()-offset
-                buffer_views.append(glTF.view_to_dict(offset, size))
-            
-            for j in range(len(self.positions)):
-                vert_ids = self.indices[j]
-                buffer_views.append(glTF.write_buffer(f, vert_ids, 'H'))
-                buffer_views.append(glTF.write_buffer(f, self.positions[j], 'f', flatten=True))
-                buffer_views.append(glTF.write_buffer(f, self.normals[j], 'f', flatten=True))
-                buffer_views.append(glTF.write_buffer(f, self.tangents[j], 'f', flatten=True))
-                if self.bones is not None:
-                    buffer_views.append(glTF.write_buffer(f, self.joints[j], 'H', flatten=True))
-                    buffer_views.append(glTF.write_buffer(f, self.weights[j], 'B', flatten=True))
-                    if self.joints2 is not None:
-                        buffer_views.append(glTF.write_buffer(f, self.joints2[j], 'H', flatten=True))
-                        buffer_views.append(glTF.write_buffer(f, self.weights2[j], 'B', flatten=True))
-
-                for texcoord in self.texcoords:
-                   buffer_views.append(glTF.write_buffer(f, texcoord[j], 'f', flatten=True))
-
-            buffer_info = [{
-                'uri' : name+'.bin',
-                'byteLength' : f.tell()
-            }]
-        return buffer_info, buffer_views
-
-    def to_dict(self, name, save_folder):
+    #log compression ratio and encode throughput of each mesh
+    def log_compression_stats(self, stats):
+        stats = stats[len(self.skins):]
+        for mesh in self.meshes:
+            view_num = mesh.get_view_num()
+            size, written, encode_time = [sum(s) for s in zip(*stats[:view_num])]
+            stats = stats[view_num:]
+            speed = size/encode_time/(1024*1024) if encode_time>0 else 0
+            logger.log('  {}: {} -> {} bytes ({:.1f}%), {:.1f} MB/s'.format(
+                mesh.name, size, written, written/max(size, 1)*100, speed), ignore_verbose=True)
+
+    def to_dict(self, buffer_views, buffer_sizes, uri=None):
         d = {
             'asset' : {
                 'generator' : 'FF7R mesh importer by MatyaModding',
@@ -250,36 +462,76 @@ class glTF:
             'scene' : 0,
             'scenes' : [
                 {
-                    'nodes' : [ 0 ]
+                    'nodes' : []
                 }
             ]
         }
         
-        if self.bones is not None:
-            d['nodes']=Bone.bones_to_nodes(self.bones)
-            d['nodes'][0]['name']=name
-            d['skins'] = [{
-                'inverseBindMatrices' : 0,
-                'skeleton' : 1,
-                'joints' : [i+1 for i in range(len(self.bones))]
-            }]
+        extensions = []
+        if any([mesh.quantized for mesh in self.meshes]):
+            extensions.append('KHR_mesh_quantization')
+        if len(buffer_sizes)>1:
+            extensions.append('EXT_meshopt_compression')
+        if len(extensions)>0:
+            d['extensionsUsed'] = extensions
+            d['extensionsRequired'] = extensions
+
+        d['nodes'], d['scenes'][0]['nodes'], skins = self.get_nodes()
+        if len(skins)>0:
+            d['skins'] = skins
             d['animations'] = []
-        else:
-            d['nodes'] = [{'name': name, 'mesh': 0}]
 
         d['materials'] = [m.to_dict() for m in self.materials]
-        d['meshes'] = self.get_meshes()
-        d['meshes'][0]['name']=name
+        d['meshes'], accessors = self.get_meshes()
         
-        buffer_info, buffer_views = self.write_buffers(name, save_folder)
-        d['buffers'] = buffer_info
+        buffer_info = {'byteLength' : buffer_sizes[0]}
+        if uri is not None:
+            buffer_info['uri'] = uri
+        d['buffers'] = [buffer_info]
+        if len(buffer_sizes)>1:
+            #fallback buffer for compressed buffer views
+            d['buffers'].append({
+                'byteLength' : buffer_sizes[1],
+                'extensions' : {'EXT_meshopt_compression' : {'fallback' : True}}
+            })
         d['bufferViews'] = buffer_views
-        d['accessors']=self.get_accessors()
+        d['accessors']=accessors
         return d
 
-    def save(self, name, save_folder):
-        d = self.to_dict(name, save_folder)
-        file=os.path.join(save_folder, name+'.gltf')
+    #jobs: the number of threads to make binary data
+    #meshopt: compress vertex and index buffers with EXT_meshopt_compression
+    def save(self, name, save_folder, file_format='gltf', jobs=1, meshopt=False):
+        if file_format not in ['gltf', 'glb']:
+            raise RuntimeError('Unsupported format. ({})'.format(file_format))
+        file=os.path.join(save_folder, name+'.'+file_format)
         logger.log('Saving '+file+'...', ignore_verbose=True)
-        with open(file, 'w') as f:
-            json.dump(d, f, indent=4)
\ No newline at end of file
+
+        stats = []
+        if file_format=='gltf':
+            with open(os.path.join(save_folder, name+'.bin'), 'wb') as f:
+                buffer_views, buffer_sizes = glTF.write_buffer_data(f, self.get_buffer_data(), jobs=jobs, meshopt=meshopt, stats=stats)
+            d = self.to_dict(buffer_views, buffer_sizes, uri=name+'.bin')
+            with open(file, 'w') as f:
+                json.dump(d, f, indent=4)
+            if meshopt:
+                self.log_compression_stats(stats)
+            return
+
+        #binary glTF: header, JSON chunk, and BIN chunk
+        #JSON needs the buffer layout. so BIN chunk is written to a temporary file first.
+        with tempfile.TemporaryFile(dir=save_folder) as bin_f:
+            buffer_views, buffer_sizes = glTF.write_buffer_data(bin_f, self.get_buffer_data(), jobs=jobs, meshopt=meshopt, stats=stats)
+            buffer_size = buffer_sizes[0]
+            d = self.to_dict(buffer_views, buffer_sizes)
+            json_bin = json.dumps(d, separators=(',', ':')).encode()
+            json_bin += b' '*((-len(json_bin))%4)
+            size = 12 + 8+len(json_bin) + 8+buffer_size
+            bin_f.seek(0)
+            with open(file, 'wb') as f:
+                f.write(struct.pack('<4sII', b'glTF', 2, size))
+                f.write(struct.pack('<I4s', len(json_bin), b'JSON'))
+                f.write(json_bin)
+                f.write(struct.pack('<I4s', buffer_size, b'BIN\x00'))
+                shutil.copyfileobj(bin_f, f)
+        if meshopt:
+            self.log_compression_stats(stats)
@@ -0,0 +1,261 @@
+import numpy as np
+
+#Encoders for EXT_meshopt_compression.
+#They write the same bitstreams as meshoptimizer. (vertex codec v0 and index codec v1)
+#Standard loaders decode them with meshoptimizer's decoder.
+
+#vertex codec
+#Vertices are split into blocks.
+#Each byte of a vertex is delta coded from the previous vertex, and zigzag coded.
+#Then, the deltas are packed in groups of 16 values with 0, 2, 4, or 8 bits per value.
+class VertexEncoder:
+    HEADER = 0xa0
+    GROUP_SIZE = 16
+    TAIL_SIZE = 32
+    MAX_ROW_SIZE = 24 #4 bits * 16 + 16 escaped bytes
+
+    def __init__(self, vertex_size):
+        if vertex_size%4!=0 or vertex_size>256:
+            raise RuntimeError('Unsupported vertex size for meshopt compression. ({})'.format(vertex_size))
+        self.vertex_size = vertex_size
+        self.block_size = min((8192//vertex_size) & ~(VertexEncoder.GROUP_SIZE-1), 256)
+        self.header = bytes([VertexEncoder.HEADER])
+        self.first_vertex = None
+        self.last_vertex = None
+        self.rest = np.zeros((0, vertex_size), dtype=np.uint8)
+        self.count = 0
+
+    def get_mode(self):
+        return 'ATTRIBUTES'
+
+    def get_stride(self):
+        return self.vertex_size
+
+    #encode a chunk of vertices. vertices in the last incomplete block will be encoded by finish()
+    def encode(self, data):
+        data = np.frombuffer(np.ascontiguousarray(data).data, dtype=np.uint8).reshape(-1, self.vertex_size)
+        self.count += len(data)
+        if self.first_vertex is None and len(data)>0:
+            self.first_vertex = data[0].copy()
+            self.last_vertex = self.first_vertex
+        if len(self.rest)>0:
+            data = np.concatenate([self.rest, data])
+        num = len(data)//self.block_size*self.block_size
+        self.rest = data[num:].copy()
+        header = self.header
+        self.header = b''
+        return header + self.encode_blocks(data[:num])
+
+    #encode the rest of vertices and the tail (the first vertex padded to 32 bytes)
+    def finish(self):
+        header = self.header
+        self.header = b''
+        data = header + self.encode_blocks(self.rest)
+        self.rest = self.rest[:0]
+        first_vertex = self.first_vertex
+        if first_vertex is None:
+            first_vertex = np.zeros(self.vertex_size, dtype=np.uint8)
+        return data + bytes(max(VertexEncoder.TAIL_SIZE-self.vertex_size, 0)) + first_vertex.tobytes()
+
+    #data: (block_size*n, vertex_size) or (less than block_size, vertex_size)
+    def encode_blocks(self, data):
+        num = len(data)
+        if num==0:
+            return b''
+        group_size = VertexEncoder.GROUP_SIZE
+        row_size = VertexEncoder.MAX_ROW_SIZE
+        block_size = min(self.block_size, -(-num//group_size)*group_size)
+        block_num = -(-num//block_size)
+
+        #delta from the previous vertex (the last vertex of the previous block for the first one)
+        delta = data - np.concatenate([self.last_vertex[None], data[:-1]])
+        delta = (delta<<1) ^ (delta.view(np.int8)>>7).view(np.uint8)
+        self.last_vertex = data[-1].copy()
+
+        #groups of 16 values: (block, byte, group, value)
+        buf = np.zeros((block_num*block_size, self.vertex_size), dtype=np.uint8)
+        buf[:num] = delta
+        group_num = block_size//group_size
+        groups = buf.reshape(block_num, block_size, self.vertex_size).transpose(0, 2, 1)
+        groups = groups.reshape(-1, group_size)
+
+        #choose the smallest encoding. ties are resolved in meshoptimizer's order (8, 0, 2, 4 bits)
+        escaped_2 = groups>=3
+        escaped_4 = groups>=15
+        escaped_num_2 = escaped_2.sum(axis=1)
+        escaped_num_4 = escaped_4.sum(axis=1)
+        sizes = np.stack([np.full(len(groups), group_size),
+                          np.where(groups.any(axis=1), group_size+1, 0),
+                          4+escaped_num_2, 8+escaped_num_4], axis=1)
+        bits_log2 = np.array([3, 0, 1, 2], dtype=np.uint8)[sizes.argmin(axis=1)]
+
+        rows = np.zeros((len(groups), row_size), dtype=np.uint8)
+        mask = np.zeros((len(groups), row_size), dtype=bool)
+        selected = bits_log2==3
+        rows[selected, :group_size] = groups[selected]
+        mask[selected, :group_size] = True
+        for log2, escaped, escaped_num in [(1, escaped_2, escaped_num_2), (2, escaped_4, escaped_num_4)]:
+            selected = bits_log2==log2
+            bits = 1<<log2
+            packed_size = group_size*bits//8
+            values = groups[selected]
+            #fixed part: values packed from the high bits (values out of range are sentinels)
+            packed = np.minimum(values, (1<<bits)-1).reshape(-1, packed_size, 8//bits).astype(np.uint32)
+            packed = (packed << np.arange(8-bits, -1, -bits, dtype=np.uint32)).sum(axis=2)
+            rows[selected, :packed_size] = packed
+            mask[selected, :packed_size] = True
+            #variable part: values out of range as full bytes
+            order = np.argsort(~escaped[selected], axis=1, kind='stable')
+            rows[selected, packed_size:packed_size+group_size] = np.take_along_axis(values, order, axis=1)
+            mask[selected, packed_size:packed_size+group_size] = np.arange(group_size)<escaped_num[selected][:, None]
+
+        #header: 2 bits per group, in front of groups of each byte
+        header_size = (group_num+3)//4
+        bits_log2 = bits_log2.reshape(-1, group_num)
+        bits_log2 = np.pad(bits_log2, ((0, 0), (0, header_size*4-group_num)))
+        headers = np.zeros((len(bits_log2), 1, row_size), dtype=np.uint8)
+        headers[:, 0, :header_size] = (bits_log2.reshape(-1, header_size, 4) << np.array([0, 2, 4, 6], dtype=np.uint8)).sum(axis=2)
+        header_mask = np.zeros(headers.shape, dtype=bool)
+        header_mask[:, 0, :header_size] = True
+
+        rows = np.concatenate([headers, rows.reshape(-1, group_num, row_size)], axis=1)
+        mask = np.concatenate([header_mask, mask.reshape(-1, group_num, row_size)], axis=1)
+        return rows[mask].tobytes()
+
+#index codec for triangle lists
+#Each triangle is encoded as a 4 bit code pair with an edge FIFO and a vertex FIFO.
+#Indices not in FIFOs are delta coded as varints.
+class IndexEncoder:
+    HEADER = 0xe1
+    #codes for feb/fec pairs. it's the same table as meshoptimizer.
+    CODEAUX_TABLE = bytes([0x00, 0x76, 0x87, 0x56, 0x67, 0x78, 0xa9, 0x86, 0x65, 0x89, 0x68, 0x98, 0x01, 0x69, 0x00, 0x00])
+    FECMAX = 13
+
+    def __init__(self, index_size):
+        self.index_size = index_size
+        self.code = bytearray()
+        self.data = bytearray()
+        self.count = 0
+        #FIFOs are dicts of (edge or vertex: push count).
+        #an entry is in FIFO if it was pushed in the last 16 times.
+        self.edge_fifo = {}
+        self.edge_num = 0
+        self.vertex_fifo = {}
+        self.vertex_num = 0
+        self.next = 0
+        self.last = 0
+
+    def get_mode(self):
+        return 'TRIANGLES'
+
+    def get_stride(self):
+        return self.index_size
+
+    def encode_index(self, index):
+        d = (index-self.last) & 0xffffffff
+        v = ((d<<1) ^ (0xffffffff if d>>31 else 0)) & 0xffffffff
+        while v>127:
+            self.data.append((v & 127) | 128)
+            v >>= 7
+        self.data.append(v)
+        self.last = index
+
+    def get_vertex_fifo(self, v):
+        if v in self.vertex_fifo:
+            i = self.vertex_num-1-self.vertex_fifo[v]
+            if i<16:
+                return i
+        return -1
+
+    def push_vertex_fifo(self, v):
+        self.vertex_fifo[v] = self.vertex_num
+        self.vertex_num += 1
+
+    def push_edge_fifo(self, a, b):
+        self.edge_fifo[(a, b)] = self.edge_num
+        self.edge_num += 1
+
+    #find the latest edge of a triangle in FIFO. returns (fifo index, rotation)
+    def get_edge_fifo(self, a, b, c):
+        found = None
+        for edge, rotation in [((a, b), 0), ((b, c), 1), ((c, a), 2)]:
+            if edge in self.edge_fifo:
+                i = self.edge_num-1-self.edge_fifo[edge]
+                if i<16 and (found is None or i<found[0]):
+                    found = (i, rotation)
+        return found
+
+    def encode(self, ids):
+        ids = np.asarray(ids).reshape(-1, 3).tolist()
+        self.count += len(ids)*3
+        code = self.code
+        fecmax = IndexEncoder.FECMAX
+        for tri in ids:
+            found = self.get_edge_fifo(*tri)
+            if found is not None and found[0]<15:
+                fe, rotation = found
+                a, b, c = tri[rotation:]+tri[:rotation]
+                fc = self.get_vertex_fifo(c)
+                if fc>=1 and fc<fecmax:
+                    fec = fc
+                elif c==self.next:
+                    fec = 0
+                    self.next += 1
+                else:
+                    fec = 15
+                #last-1 and last+1 for strip-like sequences
+                if fec==15 and c+1==self.last:
+                    fec = 13
+                    self.last = c
+                if fec==15 and c==self.last+1:
+                    fec = 14
+                    self.last = c
+                code.append((fe<<4) | fec)
+                if fec==15:
+                    self.encode_index(c)
+                if fec==0 or fec>=fecmax:
+                    self.push_vertex_fifo(c)
+                self.push_edge_fifo(c, b)
+                self.push_edge_fifo(a, c)
+                continue
+
+            rotation = 1 if tri[1]==self.next else 2 if tri[2]==self.next else 0
+            a, b, c = tri[rotation:]+tri[:rotation]
+            #0, 1, 2 after other vertices is encoded as a reset
+            reset = a==0 and b==1 and c==2 and self.next>0
+            if reset:
+                self.next = 0
+                self.vertex_fifo = {}
+            fb = self.get_vertex_fifo(b)
+            fc = self.get_vertex_fifo(c)
+            fe = []
+            for v, f in [(a, -1), (b, fb), (c, fc)]:
+                if f>=0 and f<14:
+                    fe.append(f+1)
+                elif v==self.next:
+                    fe.append(0)
+                    self.next += 1
+                else:
+                    fe.append(15)
+            fea, feb, fec = fe
+            codeaux = (feb<<4) | fec
+            codeaux_id = IndexEncoder.CODEAUX_TABLE.find(codeaux)
+            if fea==0 and codeaux_id>=0 and codeaux_id<14 and not reset:
+                code.append(0xf0 | codeaux_id)
+            else:
+                code.append(0xf0 | 14 | fea)
+                self.data.append(codeaux)
+            for v, f in [(a, fea), (b, feb), (c, fec)]:
+                if f==15:
+                    self.encode_index(v)
+            for v, f in [(a, fea), (b, feb), (c, fec)]:
+                if f==0 or f==15:
+                    self.push_vertex_fifo(v)
+            self.push_edge_fifo(b, a)
+            self.push_edge_fifo(c, b)
+            self.push_edge_fifo(a, c)
+        return b''
+
+    #header, codes of triangles, data, and the table
+    def finish(self):
+        return bytes([IndexEncoder.HEADER]) + self.code + self.data + IndexEncoder.CODEAUX_TABLE
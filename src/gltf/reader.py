@@ -0,0 +1,180 @@
+import os, json, struct, base64
+import numpy as np
+
+#componentType: dtype
+COMPONENT_TYPES = {5120: 'i1', 5121: 'u1', 5122: '<i2', 5123: '<u2', 5125: '<u4', 5126: '<f4'}
+#type: the number of components
+TYPE_SIZES = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT4': 16}
+SUPPORTED_EXTENSIONS = ['KHR_mesh_quantization']
+
+#compute tangents from UVs when glTF doesn't have them
+#tangents are accumulated per vertex, then orthogonalized to normals.
+def compute_tangents(position, normal, texcoord, indices):
+    tri = indices.reshape(-1, 3)
+    p0, p1, p2 = [position[tri[:, i]] for i in range(3)]
+    uv0, uv1, uv2 = [texcoord[tri[:, i]] for i in range(3)]
+    e1 = p1-p0
+    e2 = p2-p0
+    duv1 = uv1-uv0
+    duv2 = uv2-uv0
+    det = duv1[:, 0]*duv2[:, 1]-duv2[:, 0]*duv1[:, 1]
+    det = np.where(np.abs(det)<1e-12, 1, det)[:, None]
+    t = (e1*duv2[:, 1:2]-e2*duv1[:, 1:2])/det
+    b = (e2*duv1[:, 0:1]-e1*duv2[:, 0:1])/det
+    tangent = np.zeros(position.shape, dtype=np.float64)
+    bitangent = np.zeros(position.shape, dtype=np.float64)
+    for i in range(3):
+        np.add.at(tangent, tri[:, i], t)
+        np.add.at(bitangent, tri[:, i], b)
+    normal = normal/np.maximum(np.linalg.norm(normal, axis=1, keepdims=True), 1e-8)
+    tangent -= normal*(normal*tangent).sum(axis=1, keepdims=True)
+    length = np.linalg.norm(tangent, axis=1, keepdims=True)
+    #any vector orthogonal to the normal for degenerated UVs
+    fallback = np.cross(normal, np.where(np.abs(normal[:, :1])<0.9, [[1, 0, 0]], [[0, 1, 0]]))
+    tangent = np.where(length>1e-8, tangent/np.maximum(length, 1e-8), fallback/np.linalg.norm(fallback, axis=1, keepdims=True))
+    sign = np.where((np.cross(normal, tangent)*bitangent).sum(axis=1)<0, -1, 1)
+    return np.concatenate([tangent, sign[:, None]], axis=1).astype(np.float32)
+
+#Reader for .gltf and .glb
+class glTFReader:
+    def __init__(self, file):
+        self.file = file
+        if file[-4:]=='.glb':
+            self.data, bin_chunk = glTFReader.load_glb(file)
+        else:
+            with open(file, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+            bin_chunk = None
+        for ext in self.data.get('extensionsRequired', []):
+            if ext not in SUPPORTED_EXTENSIONS:
+                raise RuntimeError('Unsupported glTF extension. ({})'.format(ext))
+        folder = os.path.dirname(file)
+        self.buffers = [glTFReader.load_buffer(buffer, folder, bin_chunk) for buffer in self.data.get('buffers', [])]
+
+    def close(self):
+        self.buffers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    #header, JSON chunk, and BIN chunk
+    def load_glb(file):
+        with open(file, 'rb') as f:
+            magic, version, size = struct.unpack('<4sII', f.read(12))
+            if magic!=b'glTF' or version!=2:
+                raise RuntimeError('Not glTF 2.0 binary. ({})'.format(file))
+            data = None
+            bin_chunk = None
+            while f.tell()<size:
+                chunk_size, chunk_type = struct.unpack('<I4s', f.read(8))
+                chunk = f.read(chunk_size)
+                if chunk_type==b'JSON':
+                    data = json.loads(chunk.decode('utf-8'))
+                elif chunk_type==b'BIN\x00' and bin_chunk is None:
+                    bin_chunk = chunk
+        if data is None:
+            raise RuntimeError('JSON chunk not found. ({})'.format(file))
+        return data, bin_chunk
+
+    def load_buffer(buffer, folder, bin_chunk):
+        if 'uri' not in buffer:
+            if bin_chunk is None:
+                raise RuntimeError('Buffer data not found.')
+            return bin_chunk
+        uri = buffer['uri']
+        if uri.startswith('data:'):
+            return base64.b64decode(uri.split(',', 1)[1])
+        with open(os.path.join(folder, uri), 'rb') as f:
+            return f.read()
+
+    #get accessor data as (count, components) array
+    #normalized integers are converted to float32
+    def get_accessor(self, i):
+        accessor = self.data['accessors'][i]
+        if 'sparse' in accessor:
+            raise RuntimeError('Sparse accessors are not supported.')
+        dtype = np.dtype(COMPONENT_TYPES[accessor['componentType']])
+        num = TYPE_SIZES[accessor['type']]
+        count = accessor['count']
+        if 'bufferView' not in accessor:
+            data = np.zeros((count, num), dtype=dtype)
+        else:
+            view = self.data['bufferViews'][accessor['bufferView']]
+            buffer = self.buffers[view['buffer']]
+            offset = view.get('byteOffset', 0)+accessor.get('byteOffset', 0)
+            stride = view.get('byteStride', dtype.itemsize*num)
+            data = np.ndarray((count, num), dtype=dtype, buffer=buffer, offset=offset,
+                              strides=(stride, dtype.itemsize)).copy()
+        if accessor.get('normalized', False):
+            if dtype.kind=='u':
+                data = data/np.float32(np.iinfo(dtype).max)
+            else:
+                data = np.maximum(data/np.float32(np.iinfo(dtype).max), -1)
+        return data
+
+    def get_material_name(self, i):
+        if i is None:
+            return None
+        return self.data['materials'][i].get('name', 'material{}'.format(i))
+
+    #names of joints for each mesh (None for meshes without skins)
+    def get_joint_names(self):
+        nodes = self.data.get('nodes', [])
+        skins = self.data.get('skins', [])
+        joint_names = {}
+        for node in nodes:
+            if 'mesh' in node and 'skin' in node:
+                joints = skins[node['skin']]['joints']
+                joint_names.setdefault(node['mesh'], [nodes[j].get('name', '') for j in joints])
+        return joint_names
+
+    def get_mesh_names(self):
+        meshes = self.data.get('meshes', [])
+        return [mesh.get('name', 'mesh{}'.format(i)) for mesh, i in zip(meshes, range(len(meshes)))]
+
+    #get a mesh as (primitives, joint names)
+    #each primitive is a dict of attributes. (values are in glTF coordinates)
+    def get_mesh(self, i):
+        primitives = [self.get_primitive(p) for p in self.data['meshes'][i]['primitives']]
+        return primitives, self.get_joint_names().get(i)
+
+    def get_primitive(self, primitive):
+        if primitive.get('mode', 4)!=4:
+            raise RuntimeError('Only triangle lists are supported.')
+        attributes = primitive['attributes']
+        get = lambda name: self.get_accessor(attributes[name]) if name in attributes else None
+        position = get('POSITION').astype(np.float32)
+        if 'indices' in primitive:
+            indices = self.get_accessor(primitive['indices']).reshape(-1).astype(np.uint32)
+        else:
+            indices = np.arange(len(position), dtype=np.uint32)
+        normal = get('NORMAL')
+        if normal is None:
+            raise RuntimeError('Normals not found. Export the mesh with normals.')
+        texcoords = []
+        while 'TEXCOORD_{}'.format(len(texcoords)) in attributes:
+            texcoords.append(get('TEXCOORD_{}'.format(len(texcoords))).astype(np.float32))
+        tangent = get('TANGENT')
+        if tangent is None:
+            uv = texcoords[0] if len(texcoords)>0 else np.zeros((len(position), 2), dtype=np.float32)
+            tangent = compute_tangents(position, normal, uv, indices)
+        joints = []
+        weights = []
+        while 'JOINTS_{}'.format(len(joints)) in attributes:
+            weights.append(get('WEIGHTS_{}'.format(len(joints))))
+            joints.append(get('JOINTS_{}'.format(len(joints))).astype(np.uint16))
+        color = get('COLOR_0')
+        return {
+            'position': position,
+            'normal': normal.astype(np.float32),
+            'tangent': tangent.astype(np.float32),
+            'texcoords': texcoords,
+            'color': color,
+            'joints': np.concatenate(joints, axis=1) if len(joints)>0 else None,
+            'weights': np.concatenate(weights, axis=1).astype(np.float32) if len(weights)>0 else None,
+            'indices': indices,
+            'material': self.get_material_name(primitive.get('material'))
+        }
@@ -0,0 +1,89 @@
+import os, json
+from gltf.bone import Bone
+from util.io_util import mkdir
+from util.logger import logger
+
+#Skeleton data converted for glTF
+#nodes: bone nodes (children ids start from 1)
+#matrix_bin: inverse bind matrices
+class Skin:
+    def __init__(self, nodes, matrix_bin):
+        self.nodes = nodes
+        self.matrix_bin = matrix_bin
+
+    def from_bones(bones):
+        return Skin(Bone.bones_to_nodes(bones), Bone.get_matrix_bin(bones).tobytes())
+
+    def get_matrix_bin(self):
+        return self.matrix_bin
+
+    def get_bone_num(self):
+        return len(self.nodes)
+
+    #offset: node id of the first bone
+    def get_nodes(self, offset=1):
+        nodes = []
+        for node in self.nodes:
+            node = dict(node)
+            if 'children' in node:
+                node['children'] = [c-1+offset for c in node['children']]
+            nodes.append(node)
+        return nodes
+
+#Cache for skins. keys are content hashes of skeletons.
+#Skins are stored in memory, and also in cache folder if it's set.
+class SkinCache:
+    VERSION = 1
+    folder = None
+    skins = {}
+
+    def set_folder(folder):
+        SkinCache.folder = folder
+
+    def get_files(key):
+        file = os.path.join(SkinCache.folder, 'skin-v{}-{}'.format(SkinCache.VERSION, key))
+        return file+'.json', file+'.bin'
+
+    def load(key):
+        if SkinCache.folder is None:
+            return None
+        json_file, bin_file = SkinCache.get_files(key)
+        if not (os.path.exists(json_file) and os.path.exists(bin_file)):
+            return None
+        try:
+            with open(json_file, 'r') as f:
+                nodes = json.load(f)
+            with open(bin_file, 'rb') as f:
+                matrix_bin = f.read()
+        except (OSError, ValueError):
+            return None
+        if len(matrix_bin)!=len(nodes)*64:
+            return None
+        return Skin(nodes, matrix_bin)
+
+    #files are replaced at once. so other processes never read written halfway.
+    def save(key, skin):
+        if SkinCache.folder is None:
+            return
+        mkdir(SkinCache.folder)
+        json_file, bin_file = SkinCache.get_files(key)
+        tmp = '.{}.tmp'.format(os.getpid())
+        with open(bin_file+tmp, 'wb') as f:
+            f.write(skin.matrix_bin)
+        with open(json_file+tmp, 'w') as f:
+            json.dump(skin.nodes, f)
+        os.replace(bin_file+tmp, bin_file)
+        os.replace(json_file+tmp, json_file)
+
+    #get_bones: function to get bones for glTF. it will be called only when the cache doesn't have the skin.
+    def get(key, get_bones):
+        skin = SkinCache.skins.get(key)
+        if skin is None:
+            skin = SkinCache.load(key)
+            if skin is not None:
+                logger.log('Loaded skin from cache. ({})'.format(key))
+        if skin is None:
+            skin = Skin.from_bones(get_bones())
+            SkinCache.save(key, skin)
+        SkinCache.skins[key] = skin
+        return skin
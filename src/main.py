@@ -1,12 +1,16 @@
-import os, argparse, shutil
+import os, sys, argparse, shutil, traceback, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from util.io_util import *
 from util.logger import Timer, logger
 from asset.uexp import MeshUexp
+from gltf.gltf import glTF
+from gltf.reader import glTFReader
+from gltf.skin import SkinCache
 
 def get_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('ff7r_file', help='.uexp file extracted from FF7R')
-    parser.add_argument('ue4_18_file', nargs='?', help='.uexp file exported from UE4.18')
+    parser.add_argument('ue4_18_file', nargs='?', help='.uexp file exported from UE4.18 (or .gltf and .glb files)')
     parser.add_argument('save_folder', help='New uasset files will be generated here.')
     parser.add_argument('--mode', default='import', type=str, help="'import', 'export', 'removeLOD', 'valid', or 'dumpBuffers'")
     parser.add_argument('--verbose', action='store_true', help='Shows log.')
@@ -15,6 +19,16 @@ def get_args():
     parser.add_argument('--dont_remove_KDI', action='store_true', help='Does not remove KDI buffers.')
     parser.add_argument('--ignore_material_names', action='store_true', help='Does not check material names.')
     parser.add_argument('--author', default='', type=str, help='You can embed a string into uexp.')
+    parser.add_argument('--format', default='gltf', type=str, help="'gltf', 'glb', or 'psk'. File format for export mode.")
+    parser.add_argument('--lods', default=None, type=str, help="'all' or LOD ids (e.g. '0,2,3'). LODs to export in export mode. (Default: LOD0)")
+    parser.add_argument('--include_phy', action='store_true', help='Exports physical meshes as well in export mode. (experimental: each vertex is bound to a bone guessed from the weight buffer)')
+    parser.add_argument('--quantize', action='store_true', help='Exports normals, tangents, and UVs as integers with KHR_mesh_quantization.')
+    parser.add_argument('--meshopt', action='store_true', help='Compresses vertex and index buffers with EXT_meshopt_compression in export mode.')
+    parser.add_argument('--merge', action='store_true', help='Exports all meshes in ff7r_file folder as one scene in export mode.')
+    parser.add_argument('--cache_dir', default=None, type=str, help='Folder to cache converted skeletons for export mode.')
+    parser.add_argument('--batch', action='store_true', help='Processes all .uexp files in ff7r_file (and ue4_18_file) folder.')
+    parser.add_argument('--jobs', default=1, type=int, help='The number of processes for batch mode, or threads for export mode.')
+    parser.add_argument('--max_memory', default=0, type=int, help='Memory budget (MB) for batch mode. 0 means no limit.')
 
     args = parser.parse_args()
     return args
@@ -22,26 +36,31 @@ def get_args():
 def import_mesh(ff7r_file, ue4_18_file, save_folder, args):
 
     file=os.path.basename(ff7r_file)
-    trg_mesh=MeshUexp(ff7r_file)
-    src_mesh=MeshUexp(ue4_18_file)
-    trg_mesh.import_LODs(src_mesh, only_mesh=args.only_mesh, only_phy_bones=args.only_phy_bones,
-                        dont_remove_KDI=args.dont_remove_KDI, ignore_material_names=args.ignore_material_names)
-    if args.author!='':
-        trg_mesh.embed_string(args.author)
-    new_file=os.path.join(save_folder, file)
-    trg_mesh.save(new_file)
+    with MeshUexp(ff7r_file) as trg_mesh, load_source(ue4_18_file) as src_mesh:
+        trg_mesh.import_LODs(src_mesh, only_mesh=args.only_mesh, only_phy_bones=args.only_phy_bones,
+                            dont_remove_KDI=args.dont_remove_KDI, ignore_material_names=args.ignore_material_names)
+        if args.author!='':
+            trg_mesh.embed_string(args.author)
+        new_file=os.path.join(save_folder, file)
+        trg_mesh.save(new_file)
     return 'Success!'
 
+#.uexp from UE4.18, or glTF
+def load_source(ue4_18_file):
+    if ue4_18_file[-5:]=='.gltf' or ue4_18_file[-4:]=='.glb':
+        return glTFReader(ue4_18_file)
+    return MeshUexp(ue4_18_file)
+
 def remove_LOD(ff7r_file, save_folder):
     file=os.path.basename(ff7r_file)
     new_file=os.path.join(save_folder, file)
-    mesh=MeshUexp(ff7r_file)
-    mesh.remove_LODs()
-    mesh.save(new_file)
+    with MeshUexp(ff7r_file) as mesh:
+        mesh.remove_LODs()
+        mesh.save(new_file)
     return 'Success!'
 
-def valid(ff7r_file, save_folder):
-    save_folder = 'workspace/valid'
+def valid(ff7r_file, save_folder, workspace='workspace/valid'):
+    save_folder = workspace
     if os.path.exists(save_folder):
         shutil.rmtree(save_folder)
     mkdir(save_folder)
@@ -49,10 +68,11 @@ def valid(ff7r_file, save_folder):
     file=os.path.basename(ff7r_file)
     new_file=os.path.join(save_folder, file)
 
-    mesh=MeshUexp(ff7r_file)
-    author = mesh.get_author()
-
-    mesh.save(new_file)
+    with MeshUexp(ff7r_file) as mesh:
+        author = mesh.get_author()
+        #parse LODs to check the parsers and writers. raw bytes of unparsed LODs always pass the test.
+        mesh.parse_LODs()
+        mesh.save(new_file)
     try:
         compare(ff7r_file, new_file)
         compare(ff7r_file[:-4]+'uasset', new_file[:-4]+'uasset')
@@ -66,16 +86,49 @@ def dump_buffers(ff7r_file, save_folder):
     file=os.path.basename(ff7r_file)
     folder=os.path.join(save_folder, file[:-5])
     mkdir(folder)
-    mesh=MeshUexp(ff7r_file)
-    mesh.dump_buffers(folder)
+    with MeshUexp(ff7r_file) as mesh:
+        mesh.dump_buffers(folder)
     return 'Success!'
 
-def export_as_gltf(ff7r_file, save_folder):
+def export_as_gltf(ff7r_file, save_folder, args):
     file=os.path.basename(ff7r_file)
     folder=os.path.join(save_folder, file[:-5])
     mkdir(folder)
-    mesh=MeshUexp(ff7r_file)
-    mesh.save_as_gltf(folder)
+    with MeshUexp(ff7r_file) as mesh:
+        if args.format=='psk':
+            mesh.save_as_psk(folder, lods=args.lods)
+            return 'Success!'
+        #batch mode uses processes instead of threads
+        jobs = 1 if args.batch else args.jobs
+        mesh.save_as_gltf(folder, file_format=args.format, lods=args.lods, jobs=jobs,
+                          include_phy=args.include_phy, quantize=args.quantize, meshopt=args.meshopt)
+    return 'Success!'
+
+#exports all meshes in a folder as a scene
+def export_as_merged_gltf(ff7r_folder, save_folder, args):
+    if not os.path.isdir(ff7r_folder):
+        raise RuntimeError('Specify a folder. ({})'.format(ff7r_folder))
+    if args.format=='psk':
+        raise RuntimeError('Merge mode does not support psk.')
+    name=os.path.basename(os.path.normpath(ff7r_folder))
+    gltf=glTF()
+    #buffers are parsed when saving. assets are closed after that.
+    meshes=[]
+    try:
+        for file in sorted(find_uexp_files(ff7r_folder, exclude=save_folder)):
+            mesh=MeshUexp(file)
+            meshes.append(mesh)
+            if mesh.asset_type=='Skeleton':
+                logger.log('Skipped {}. (Skeleton asset)'.format(file), ignore_verbose=True)
+                continue
+            mesh.add_to_gltf(gltf, lods=args.lods, include_phy=args.include_phy, quantize=args.quantize)
+        if len(gltf.meshes)==0:
+            raise RuntimeError('Mesh assets not found. ({})'.format(ff7r_folder))
+        logger.log('Meshes: {}, Skins: {}, Materials: {}'.format(len(gltf.meshes), len(gltf.skins), len(gltf.materials)), ignore_verbose=True)
+        gltf.save(name, save_folder, file_format=args.format, jobs=args.jobs, meshopt=args.meshopt)
+    finally:
+        for mesh in meshes:
+            mesh.close()
     return 'Success!'
 
 def uasset_to_uexp(file_name):
@@ -83,6 +136,152 @@ def uasset_to_uexp(file_name):
         file_name=file_name[:-6]+'uexp'
     return file_name
 
+#memory usage of a job is estimated as (uexp size)*BATCH_MEMORY_RATE
+BATCH_MEMORY_RATE=16
+
+#check if folder is parent or the same folder (paths are compared by components, not by strings)
+def is_subfolder(folder, parent):
+    folder=os.path.normcase(os.path.abspath(folder))
+    parent=os.path.normcase(os.path.abspath(parent))
+    try:
+        return os.path.commonpath([folder, parent])==parent
+    except ValueError: #different drives
+        return False
+
+#exclude: skips files in this folder. (ignored when it contains the whole folder)
+def find_uexp_files(folder, exclude=None):
+    if exclude is not None and is_subfolder(folder, exclude):
+        exclude=None
+    files=[]
+    for root, dirs, names in os.walk(folder):
+        if exclude is not None and is_subfolder(root, exclude):
+            dirs[:]=[]
+            continue
+        for name in names:
+            file=os.path.join(root, name)
+            if name[-5:]=='.uexp' and os.path.exists(file[:-4]+'uasset'):
+                files.append(file)
+    return files
+
+#finds a .uexp file from ue4_18_folder for ff7r_file.
+#the same relative path has priority over the same file name.
+def find_source_file(ff7r_file, ff7r_folder, ue4_18_folder, ue4_18_files):
+    rel_path=os.path.relpath(ff7r_file, ff7r_folder)
+    file=os.path.join(ue4_18_folder, rel_path)
+    if os.path.exists(file):
+        return file
+    name=os.path.basename(ff7r_file)
+    found=[f for f in ue4_18_files if os.path.basename(f)==name]
+    if len(found)==1:
+        return found[0]
+    return None
+
+def init_batch_worker(verbose, cache_dir):
+    logger.set_verbose(verbose)
+    SkinCache.set_folder(cache_dir)
+
+def run_batch_job(mode, ff7r_file, ue4_18_file, save_folder, args):
+    timer = Timer()
+    logger.log('mode: '+mode)
+    try:
+        mkdir(save_folder)
+        if mode=='import':
+            if ue4_18_file is None:
+                raise RuntimeError('Source file not found.')
+            msg = import_mesh(ff7r_file, ue4_18_file, save_folder, args)
+        elif mode=='valid':
+            workspace=os.path.join('workspace', 'valid', str(os.getpid()))
+            msg = valid(ff7r_file, save_folder, workspace=workspace)
+        elif mode=='export':
+            msg = export_as_gltf(ff7r_file, save_folder, args)
+        else:
+            functions = {'removeLOD': remove_LOD, 'dumpBuffers': dump_buffers}
+            msg = functions[mode](ff7r_file, save_folder)
+        success=True
+    except Exception as e:
+        logger.log(traceback.format_exc()[:-1])
+        msg='{}: {}'.format(type(e).__name__, e)
+        success=False
+    t=timer.now()
+    logger.log('{} Run time (s): {}'.format(msg, t))
+    logger.flush()
+    return success, msg, t
+
+def batch(ff7r_folder, ue4_18_folder, save_folder, mode, args):
+    if not os.path.isdir(ff7r_folder):
+        raise RuntimeError('Specify a folder for batch mode.')
+    if mode=='import' and (ue4_18_folder is None or not os.path.isdir(ue4_18_folder)):
+        raise RuntimeError('Specify a folder for ue4_18_file.')
+    if mode not in ['import', 'export', 'removeLOD', 'valid', 'dumpBuffers']:
+        raise RuntimeError('Unsupported mode.')
+
+    files=find_uexp_files(ff7r_folder, exclude=save_folder)
+    if mode=='import':
+        ue4_18_files=find_uexp_files(ue4_18_folder)
+
+    #largest assets first
+    jobs=[]
+    for file in files:
+        rel_folder=os.path.dirname(os.path.relpath(file, ff7r_folder))
+        src_file=None
+        if mode=='import':
+            src_file=find_source_file(file, ff7r_folder, ue4_18_folder, ue4_18_files)
+        size=os.path.getsize(file)
+        jobs.append((size, file, src_file, os.path.join(save_folder, rel_folder)))
+    jobs.sort(key=lambda job: job[0], reverse=True)
+    logger.log('Found {} assets.'.format(len(jobs)), ignore_verbose=True)
+
+    budget=args.max_memory*1024*1024
+    def get_memory(job):
+        return job[0]*BATCH_MEMORY_RATE
+
+    results={}
+    executor=ProcessPoolExecutor(max_workers=max(1, args.jobs), mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_batch_worker, initargs=(args.verbose, args.cache_dir))
+    with executor:
+        running={}
+        used_memory=0
+        while len(jobs)>0 or len(running)>0:
+            #submit jobs while they fit in the memory budget
+            while len(jobs)>0 and len(running)<max(1, args.jobs):
+                job=None
+                for j in jobs:
+                    if budget<=0 or used_memory+get_memory(j)<=budget:
+                        job=j
+                        break
+                if job is None:
+                    if len(running)>0:
+                        break
+                    job=jobs[0]
+                jobs.remove(job)
+                _, file, src_file, folder=job
+                future=executor.submit(run_batch_job, mode, file, src_file, folder, args)
+                running[future]=job
+                used_memory+=get_memory(job)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job=running.pop(future)
+                used_memory-=get_memory(job)
+                file=job[1]
+                try:
+                    results[file]=future.result()
+                except Exception as e:
+                    results[file]=(False, '{}: {}'.format(type(e).__name__, e), 0)
+                success, msg, t = results[file]
+                logger.log('{} {} ({:.2f}s)'.format('OK' if success else 'NG', file, t), ignore_verbose=True)
+
+    #summary
+    failed=[file for file in files if not results[file][0]]
+    logger.log('Summary', ignore_verbose=True)
+    for file in sorted(files):
+        success, msg, _ = results[file]
+        logger.log('  {}: {}'.format(file, msg), ignore_verbose=True)
+    logger.log('Succeeded: {}, Failed: {}'.format(len(files)-len(failed), len(failed)), ignore_verbose=True)
+    if len(failed)>0:
+        raise RuntimeError('Failed to process {} of {} assets.'.format(len(failed), len(files)))
+    return 'Done!'
+
 if __name__=='__main__':
     timer = Timer()
     args = get_args()
@@ -93,30 +292,49 @@ if __name__=='__main__':
     verbose=args.verbose
 
     logger.set_verbose(verbose)
+    SkinCache.set_folder(args.cache_dir)
 
     try:
-        if ff7r_file=='' or os.path.isdir(ff7r_file):
-            raise RuntimeError('Specify uexp file.')
-        if os.path.dirname(ff7r_file)==save_folder:
-            raise RuntimeError('Save folder must be different from the original asset folder.')
-        if save_folder!='':
+        if args.batch:
+            if os.path.abspath(ff7r_file)==os.path.abspath(save_folder):
+                raise RuntimeError('Save folder must be different from the original asset folder.')
             mkdir(save_folder)
-        
-        logger.log('mode: '+mode)
-        if mode=='import':
-            if ue4_18_file=='' or os.path.isdir(ue4_18_file):
-                raise RuntimeError('Specify uexp file.')
-            msg = import_mesh(ff7r_file, ue4_18_file, save_folder, args)
+            logger.log('mode: '+mode+' (batch)')
+            msg = batch(ff7r_file, ue4_18_file, save_folder, mode, args)
+        elif args.merge:
+            if mode!='export':
+                raise RuntimeError('--merge is only for export mode.')
+            if os.path.abspath(ff7r_file)==os.path.abspath(save_folder):
+                raise RuntimeError('Save folder must be different from the original asset folder.')
+            mkdir(save_folder)
+            logger.log('mode: '+mode+' (merge)')
+            msg = export_as_merged_gltf(ff7r_file, save_folder, args)
         else:
-            functions = {'export': export_as_gltf, 'removeLOD': remove_LOD, 'valid': valid, 'dumpBuffers': dump_buffers}
-            if mode not in functions:
-                raise RuntimeError('Unsupported mode.')
-            msg = functions[mode](ff7r_file, save_folder)
+            if ff7r_file=='' or os.path.isdir(ff7r_file):
+                raise RuntimeError('Specify uexp file.')
+            if os.path.dirname(ff7r_file)==save_folder:
+                raise RuntimeError('Save folder must be different from the original asset folder.')
+            if save_folder!='':
+                mkdir(save_folder)
+
+            logger.log('mode: '+mode)
+            if mode=='import':
+                if ue4_18_file=='' or os.path.isdir(ue4_18_file):
+                    raise RuntimeError('Specify uexp file.')
+                msg = import_mesh(ff7r_file, ue4_18_file, save_folder, args)
+            elif mode=='export':
+                msg = export_as_gltf(ff7r_file, save_folder, args)
+            else:
+                functions = {'removeLOD': remove_LOD, 'valid': valid, 'dumpBuffers': dump_buffers}
+                if mode not in functions:
+                    raise RuntimeError('Unsupported mode.')
+                msg = functions[mode](ff7r_file, save_folder)
         t=timer.now()
         logger.log('{} Run time (s): {}'.format(msg, t))
         logger.close()
 
     except Exception as e:
         logger.error()
+        sys.exit(1)
 
     
@@ -0,0 +1,131 @@
+import struct
+import numpy as np
+from util.logger import logger
+
+#PSK (ActorX) format
+#Chunks are written with structured arrays.
+#The layout follows UE Viewer's exporter.
+#  - The Y axis is mirrored, and faces are flipped to keep their winding.
+#  - Rotations of bones (except the root bone) are conjugated.
+#  - Vertices with the same position share a point.
+
+#VVertex
+WEDGE_DTYPE = np.dtype([('point_id', '<u4'), ('uv', '<f4', 2), ('material_id', 'u1'), ('reserved', 'u1'), ('pad', '<u2')])
+#VTriangle16 and VTriangle32
+FACE_DTYPE = np.dtype([('wedge_ids', '<u2', 3), ('material_id', 'u1'), ('aux_material_id', 'u1'), ('smoothing_groups', '<u4')])
+FACE32_DTYPE = np.dtype([('wedge_ids', '<u4', 3), ('material_id', 'u1'), ('aux_material_id', 'u1'), ('smoothing_groups', '<u4')])
+#VMaterial
+MATERIAL_DTYPE = np.dtype([('name', 'S64'), ('texture_id', '<i4'), ('poly_flags', '<u4'), ('aux_material', '<i4'),
+                           ('aux_flags', '<u4'), ('lod_bias', '<i4'), ('lod_style', '<i4')])
+#VBone
+BONE_DTYPE = np.dtype([('name', 'S64'), ('flags', '<u4'), ('children_num', '<i4'), ('parent', '<i4'),
+                       ('rot', '<f4', 4), ('trans', '<f4', 3), ('length', '<f4'), ('size', '<f4', 3)])
+#VRawBoneInfluence
+INFLUENCE_DTYPE = np.dtype([('weight', '<f4'), ('point_id', '<i4'), ('bone_id', '<i4')])
+
+class PSK:
+    VERSION = 20100422
+
+    #material_names: names of materials
+    #position: positions of vertices (UE coordinates)
+    #texcoords: UV maps of vertices (vertex_num, uv_num, 2)
+    #material_ids: material ids of vertices
+    #indices: vertex ids of faces
+    #face_material_ids: material ids of faces
+    #color: RGBA colors of vertices (or None)
+    def __init__(self, material_names, position, texcoords, material_ids, indices, face_material_ids, color=None):
+        if len(material_names)>256:
+            raise RuntimeError('PSK supports up to 256 materials. ({})'.format(len(material_names)))
+        self.material_names = material_names
+        self.position = position
+        self.texcoords = texcoords
+        self.material_ids = material_ids
+        self.indices = indices
+        self.face_material_ids = face_material_ids
+        self.color = color
+        self.bones = np.zeros(0, dtype=BONE_DTYPE)
+        self.joint = None
+        self.weight = None
+
+    #names: bone names
+    #parents: parent ids (-1 for the root bone)
+    #poses: rotations, translations, and scales of bones (bone_num, 10)
+    #joint, weight: bone ids and weights (uint8) of vertices
+    def set_skeleton(self, names, parents, poses, joint, weight):
+        parents = np.asarray(parents, dtype=np.int32)
+        poses = np.asarray(poses, dtype=np.float32)
+        bones = np.zeros(len(names), dtype=BONE_DTYPE)
+        bones['name'] = [name.encode()[:63] for name in names]
+        bones['children_num'] = np.bincount(parents[parents>=0], minlength=len(names))
+        bones['parent'] = np.maximum(parents, 0)
+        rot = poses[:, 0:4].copy()
+        rot[1:, :3] *= -1
+        rot[:, [1, 3]] *= -1
+        bones['rot'] = rot
+        bones['trans'] = poses[:, 4:7]*[1, -1, 1]
+        bones['length'] = 1
+        bones['size'] = 1
+        self.bones = bones
+        self.joint = joint
+        self.weight = weight
+
+    def write_chunk(f, chunk_id, data=None, size=0):
+        count = 0
+        if data is not None:
+            size = data.dtype.itemsize
+            count = len(data)
+        f.write(struct.pack('<20s3i', chunk_id.encode(), PSK.VERSION, size, count))
+        if data is not None:
+            f.write(np.ascontiguousarray(data).data)
+
+    #merge vertices with the same position into a point
+    def get_points(self):
+        points, first_ids, point_ids = np.unique(self.position, axis=0, return_index=True, return_inverse=True)
+        return points, first_ids, point_ids.reshape(-1)
+
+    #influences of the first vertex of each point
+    def get_influences(self, first_ids):
+        if self.joint is None:
+            return np.zeros(0, dtype=INFLUENCE_DTYPE)
+        joint = self.joint[first_ids]
+        weight = self.weight[first_ids]
+        point_ids, slots = np.nonzero(weight)
+        influences = np.zeros(len(point_ids), dtype=INFLUENCE_DTYPE)
+        influences['weight'] = weight[point_ids, slots]/255
+        influences['point_id'] = point_ids
+        influences['bone_id'] = joint[point_ids, slots]
+        return influences
+
+    def save(self, file):
+        logger.log('Saving '+file+'...', ignore_verbose=True)
+        points, first_ids, point_ids = self.get_points()
+        points = (points*[1, -1, 1]).astype(np.float32)
+
+        wedges = np.zeros(len(point_ids), dtype=WEDGE_DTYPE)
+        wedges['point_id'] = point_ids
+        wedges['uv'] = self.texcoords[:, 0]
+        wedges['material_id'] = self.material_ids
+
+        face_dtype = FACE_DTYPE if len(wedges)<=65536 else FACE32_DTYPE
+        faces = np.zeros(len(self.indices)//3, dtype=face_dtype)
+        faces['wedge_ids'] = self.indices.reshape(-1, 3)[:, [1, 0, 2]]
+        faces['material_id'] = self.face_material_ids
+
+        materials = np.zeros(len(self.material_names), dtype=MATERIAL_DTYPE)
+        materials['name'] = [name.encode()[:63] for name in self.material_names]
+        materials['texture_id'] = np.arange(len(materials))
+
+        with open(file, 'wb') as f:
+            PSK.write_chunk(f, 'ACTRHEAD')
+            PSK.write_chunk(f, 'PNTS0000', points.view(np.dtype([('xyz', '<f4', 3)])).reshape(-1))
+            PSK.write_chunk(f, 'VTXW0000', wedges)
+            PSK.write_chunk(f, 'FACE0000' if face_dtype==FACE_DTYPE else 'FACE3200', faces)
+            PSK.write_chunk(f, 'MATT0000', materials)
+            PSK.write_chunk(f, 'REFSKELT', self.bones)
+            PSK.write_chunk(f, 'RAWWEIGHTS', self.get_influences(first_ids))
+            for j in range(1, self.texcoords.shape[1]):
+                uv = np.ascontiguousarray(self.texcoords[:, j], dtype=np.float32)
+                PSK.write_chunk(f, 'EXTRAUVS{}'.format(j-1), uv.view(np.dtype([('uv', '<f4', 2)])).reshape(-1))
+            if self.color is not None:
+                color = np.ascontiguousarray(self.color, dtype=np.uint8)
+                PSK.write_chunk(f, 'VERTEXCOLOR', color.view(np.dtype([('rgba', 'u1', 4)])).reshape(-1))
@@ -1,9 +1,66 @@
-import os, struct
+import os, struct, mmap
+import numpy as np
 from util.logger import logger
 
 def mkdir(dir):
     os.makedirs(dir, exist_ok=True)
 
+#Read-only file object for memory-mapped files.
+#read() returns memoryview slices of the map instead of copying bytes.
+class MemoryReader:
+    def __init__(self, buf, map=None):
+        self.view = memoryview(buf)
+        self.map = map
+        self.pos = 0
+
+    def open(file):
+        with open(file, 'rb') as f:
+            if get_size(f)==0:
+                return MemoryReader(b'')
+            map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return MemoryReader(map, map=map)
+
+    #release the memory map.
+    #if slices are still used by other objects, the map will be unmapped when they are freed.
+    def close(self):
+        self.view.release()
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                pass
+            self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, size=-1):
+        if size is None or size<0:
+            end = len(self.view)
+        else:
+            end = min(self.pos+size, len(self.view))
+        view = self.view[self.pos:end]
+        self.pos = max(end, self.pos)
+        return view
+
+    def seek(self, offset, whence=0):
+        if whence==0:
+            pos = offset
+        elif whence==1:
+            pos = self.pos+offset
+        else:
+            pos = len(self.view)+offset
+        if pos<0:
+            raise ValueError('negative seek position {}'.format(pos))
+        self.pos = pos
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
 def get_size(file):
     pos=file.tell()
     file.seek(0,2)
@@ -49,26 +106,36 @@ def read_array(file, read_func, len=None):
     ary=[read_func(file) for i in range(len)]
     return ary
 
+#read an array of numbers at once
+def read_typed_array(file, dtype, len=None):
+    if len is None:
+        len = read_uint32(file)
+    dtype = np.dtype(dtype)
+    ary = np.frombuffer(file.read(dtype.itemsize*len), dtype=dtype, count=len)
+    return ary.tolist()
+
 def read_uint32_array(file, len=None):
-    return read_array(file, read_uint32, len=len)
+    return read_typed_array(file, '<u4', len=len)
 
 def read_uint16_array(file, len=None):
-    return read_array(file, read_uint16, len=len)
+    return read_typed_array(file, '<u2', len=len)
 
 def read_uint8_array(file, len=None):
-    return read_array(file, read_uint8, len=len)
+    return read_typed_array(file, 'u1', len=len)
 
 def read_int32_array(file, len=None):
-    return read_array(file, read_int32, len=len)
+    return read_typed_array(file, '<i4', len=len)
 
 def read_float32_array(file, len=None):
-    return read_array(file, read_float32, len=len)
+    return read_typed_array(file, '<f4', len=len)
 
 def read_vec3_f32(file):
     return read_float32_array(file, len=3)
 
 def read_vec3_f32_array(file):
-    return read_array(file, read_vec3_f32)
+    len = read_uint32(file)
+    ary = np.frombuffer(file.read(12*len), dtype='<f4', count=3*len)
+    return ary.reshape(len, 3).tolist()
 
 def read_16byte(file):
     return file.read(16)
@@ -77,10 +144,34 @@ def read_str(file):
     num = read_uint32(file)
     if num==0:
         return None
-    string = file.read(num-1).decode()
+    string = bytes(file.read(num-1)).decode()
     file.seek(1,1)
     return string
 
+#find a byte pattern from the current position.
+#returns the offset of the pattern (or -1) and doesn't move the file pointer.
+def find_bytes(f, pattern, max_size=None, chunk_size=0x10000):
+    offset=f.tell()
+    pos=offset
+    tail=b''
+    found=-1
+    while max_size is None or pos-offset<max_size:
+        size=chunk_size
+        if max_size is not None:
+            size=min(size, offset+max_size-pos)
+        chunk=f.read(size)
+        if len(chunk)==0:
+            break
+        buf=b''.join([tail, chunk])
+        i=buf.find(pattern)
+        if i>=0:
+            found=pos-len(tail)+i
+            break
+        tail=buf[max(0, len(buf)-len(pattern)+1):]
+        pos+=len(chunk)
+    f.seek(offset)
+    return found
+
 def read_const_uint32(f, n, msg='Unexpected Value!'):
     const = read_uint32(f)
     check(const, n, f, msg)
@@ -122,29 +213,41 @@ def write_array(file, ary, write_func, with_length=False):
     for a in ary:
         write_func(file, a)
 
+#write an array of numbers at once
+def write_typed_array(file, ary, dtype, with_length=False):
+    if with_length:
+        write_uint32(file, len(ary))
+    file.write(np.asarray(ary, dtype=dtype).tobytes())
+
 def write_uint32_array(file, ary, with_length=False):
-    write_array(file, ary, write_uint32, with_length=with_length)
+    write_typed_array(file, ary, '<u4', with_length=with_length)
 
 def write_uint16_array(file, ary, with_length=False):
-    write_array(file, ary, write_uint16, with_length=with_length)
+    write_typed_array(file, ary, '<u2', with_length=with_length)
 
 def write_uint8_array(file, ary, with_length=False):
-    write_array(file, ary, write_uint8, with_length=with_length)
+    write_typed_array(file, ary, 'u1', with_length=with_length)
 
 def write_int32_array(file, ary, with_length=False):
-    write_array(file, ary, write_int32, with_length=with_length)
+    write_typed_array(file, ary, '<i4', with_length=with_length)
 
 def write_float32_array(file, ary, with_length=False):
-    write_array(file, ary, write_float32, with_length=with_length)
+    write_typed_array(file, ary, '<f4', with_length=with_length)
 
+#finite values out of float16 range raise an error like struct.pack('<e')
 def write_float16_array(file, ary, with_length=False):
-    write_array(file, ary, write_float16, with_length=with_length)
+    ary = np.asarray(ary)
+    with np.errstate(over='ignore'):
+        converted = ary.astype('<f2')
+    if not np.array_equal(np.isfinite(converted), np.isfinite(ary)):
+        raise OverflowError('float too large to pack with e format')
+    write_typed_array(file, converted, '<f2', with_length=with_length)
 
 def write_vec3_f32(file, vec3):
     write_float32_array(file, vec3)
 
 def write_vec3_f32_array(file, vec_ary, with_length=False):
-    return write_array(file, vec_ary, write_vec3_f32, with_length=with_length)
+    write_typed_array(file, vec_ary, '<f4', with_length=with_length)
 
 def write_16byte(file, bin):
     return file.write(bin)
@@ -1,12 +1,17 @@
-import time, os, traceback
+import time, os, traceback, multiprocessing
 
 class Logger:
     LOG_FOLDER='log'
     def __init__(self):
         os.makedirs(Logger.LOG_FOLDER, exist_ok=True)
-        self.file_name = time.strftime('%Y%m%d-%H%M%S'+'.txt')
+        self.file_name = time.strftime('%Y%m%d-%H%M%S')
+        if multiprocessing.current_process().name!='MainProcess':
+            #worker processes of batch mode have their own log files
+            self.file_name += '-{}'.format(os.getpid())
+        self.file_name += '.txt'
         file_path=os.path.join(Logger.LOG_FOLDER, self.file_name)
         self.f=open(file_path, 'w')
+        self.verbose=False
 
     def set_verbose(self, verbose):
         self.verbose=verbose
@@ -19,6 +24,9 @@ class Logger:
         if self.verbose or ignore_verbose:
             print(string)
 
+    def flush(self):
+        self.f.flush()
+
     def error(self):
         self.log(traceback.format_exc()[:-1])
         self.close()
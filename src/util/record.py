@@ -0,0 +1,94 @@
+import struct
+from util.io_util import check
+
+#Fixed-size binary record compiled into a single struct.Struct.
+#fields: (name, format) for values,
+#        (None, format, const) or (None, format, const, msg) for constants.
+#Fields with the same name should have the same value.
+#A format with multiple values (e.g. '4B') is stored as a list.
+class Record:
+    DEFAULT_MSG='Parse failed. This is unexpected error.'
+
+    def __init__(self, fields):
+        form='<'
+        self.names=[]
+        self.consts=[]
+        self.value_slices=[]
+        self.const_ids=[]
+        self.const_values=[]
+        self.const_msgs=[]
+        self.bytes_ids=[]
+        i=0
+        for field in fields:
+            name, field_form = field[:2]
+            count=len(struct.unpack('<'+field_form, bytes(struct.calcsize('<'+field_form))))
+            if field_form[-1]=='s':
+                self.bytes_ids.append(i)
+            if name is None:
+                const=field[2]
+                msg=field[3] if len(field)>3 else Record.DEFAULT_MSG
+                if count==1:
+                    const=[const]
+                self.const_ids+=range(i, i+count)
+                self.const_values+=const
+                self.const_msgs+=[msg]*count
+            else:
+                self.names.append(name)
+                self.value_slices.append((i, count))
+            form+=field_form
+            i+=count
+        self.const_values=tuple(self.const_values)
+        self.field_num=i
+        self.struct=struct.Struct(form)
+        self.size=self.struct.size
+
+        #fields with one value and a unique name are set by one dict update
+        self.single_names=[]
+        self.single_ids=[]
+        self.multi_fields=[]
+        for name, (i, count) in zip(self.names, self.value_slices):
+            if count==1 and self.names.count(name)==1:
+                self.single_names.append(name)
+                self.single_ids.append(i)
+            else:
+                self.multi_fields.append((name, i, count))
+
+    def check(self, values, f=None):
+        consts=tuple(values[i] for i in self.const_ids)
+        if consts==self.const_values:
+            return
+        for actual, expected, msg in zip(consts, self.const_values, self.const_msgs):
+            check(actual, expected, f, msg)
+
+    #read a record and set its values as attributes of obj
+    def read(self, f, obj):
+        buf=f.read(self.size)
+        if len(buf)<self.size:
+            raise RuntimeError('Parse failed. (Unexpected end of file)')
+        values=self.struct.unpack(buf)
+        self.check(values, f)
+        obj.__dict__.update(zip(self.single_names, [values[i] for i in self.single_ids]))
+        multi_values={}
+        for name, i, count in self.multi_fields:
+            value=values[i] if count==1 else list(values[i:i+count])
+            if name in multi_values:
+                check(value, multi_values[name], f)
+            multi_values[name]=value
+        obj.__dict__.update(multi_values)
+        return obj
+
+    #write attributes of obj as a record
+    #keyword arguments overwrite the attributes.
+    def write(self, f, obj, **kwargs):
+        values=[None]*self.field_num
+        for i, const in zip(self.const_ids, self.const_values):
+            values[i]=const
+        for name, (i, count) in zip(self.names, self.value_slices):
+            value=kwargs[name] if name in kwargs else getattr(obj, name)
+            if count==1:
+                values[i]=value
+            else:
+                values[i:i+count]=value
+        for i in self.bytes_ids:
+            values[i]=bytes(values[i])
+        f.write(self.struct.pack(*values))
@@ -0,0 +1,42 @@
+import os, sys, argparse
+
+#modules are imported from src like main.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from asset.uexp import MeshUexp
+from gltf.gltf import glTF
+from test_gltf_scaling import make_static_mesh, VERTEX_NUMS
+
+#Encodes meshes with EXT_meshopt_compression, and reports sizes and encode throughput of each mesh.
+#usage: python bench_meshopt.py [uexp files] [--quantize]
+#A synthetic static mesh (the same as test_gltf_scaling.py) is used when no files are specified.
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*', help='.uexp files to encode.')
+    parser.add_argument('--quantize', action='store_true', help='Encodes quantized normals, tangents, and UVs.')
+    return parser.parse_args()
+
+#encode buffer views of each mesh, and get (name, raw size, encoded size, encode time)
+def encode_meshes(gltf):
+    results = []
+    with open(os.devnull, 'wb') as f:
+        for mesh in gltf.meshes:
+            stats = []
+            glTF.write_buffer_data(f, mesh.get_buffer_data(), meshopt=True, stats=stats)
+            size, written, encode_time = [sum(s) for s in zip(*stats)]
+            results.append((mesh.name, size, written, encode_time))
+    return results
+
+if __name__=='__main__':
+    args = get_args()
+    gltf = glTF()
+    if len(args.files)==0:
+        make_static_mesh(VERTEX_NUMS).add_to_gltf(gltf, 'synthetic', quantize=args.quantize)
+    for file in args.files:
+        with MeshUexp(file) as mesh:
+            mesh.add_to_gltf(gltf, quantize=args.quantize)
+    print('{:<32} {:>12} {:>12} {:>8} {:>10}'.format('mesh', 'raw bytes', 'encoded', 'ratio', 'MB/s'))
+    for name, size, written, encode_time in encode_meshes(gltf):
+        speed = size/encode_time/(1024*1024) if encode_time>0 else 0
+        print('{:<32} {:>12} {:>12} {:>7.1f}% {:>10.1f}'.format(name, size, written, written/max(size, 1)*100, speed))
@@ -0,0 +1,26 @@
+import os
+import numpy as np
+
+from asset.buffer import PositionVertexBuffer, StaticMeshVertexBuffer, StaticIndexBuffer
+from asset.lod import StaticLOD
+from asset.lod_section import StaticLODSection
+from asset.material import NamedMaterial
+from asset.mesh import StaticMesh
+from gltf.gltf import glTF
+
+def test_position_range_of_empty_section():
+    assert glTF.get_position_range(np.zeros((0, 3), dtype=np.float32))==([0, 0, 0], [0, 0, 0])
+
+#the second section has no vertices and no faces
+def test_export_with_empty_section(tmp_path):
+    position = np.arange(12, dtype=np.float32).reshape(4, 3)
+    tangent_basis = np.full((4, 8), 128, dtype=np.uint8)
+    texcoords = np.zeros((4, 1, 2), dtype=np.float32)
+    indices = np.array([0, 1, 2, 1, 2, 3])
+    sections = [StaticLODSection.build(0, 0, 2, 0, 3), StaticLODSection.build(1, 6, 0, 4, 4)]
+    lod = StaticLOD(None, sections, b'\x00'*4, PositionVertexBuffer.build(position),
+                    StaticMeshVertexBuffer.build(tangent_basis, texcoords, False), None,
+                    StaticIndexBuffer.build(indices, 0), StaticIndexBuffer.build(indices, 0, name='IB2'), b'\x00'*48)
+    mesh = StaticMesh(None, [NamedMaterial('a'), NamedMaterial('b')], [lod])
+    mesh.save_as_gltf('empty', str(tmp_path), file_format='glb')
+    assert os.path.exists(os.path.join(str(tmp_path), 'empty.glb'))
@@ -0,0 +1,74 @@
+import os, json, struct, time, tracemalloc
+import numpy as np
+
+from asset.buffer import PositionVertexBuffer, StaticMeshVertexBuffer, StaticIndexBuffer
+from asset.lod import StaticLOD
+from asset.lod_section import StaticLODSection
+from asset.material import NamedMaterial
+from asset.mesh import StaticMesh
+from gltf.gltf import glTF
+
+#a small section and a large section (more than 65535 vertices)
+VERTEX_NUMS = [1000, 1200000]
+#limits for exporting the LOD
+MAX_TIME = 0.3
+MAX_MEMORY = 110*1024*1024
+
+#static LOD with triangle strips (i, i+1, i+2) in each section
+def make_static_mesh(vertex_nums):
+    vertex_num = sum(vertex_nums)
+    rng = np.random.default_rng(0)
+    position = rng.random((vertex_num, 3), dtype=np.float32)*100
+    tangent_basis = np.full((vertex_num, 8), 128, dtype=np.uint8)
+    texcoords = rng.random((vertex_num, 1, 2), dtype=np.float32)
+
+    sections = []
+    indices = []
+    first = 0
+    for num, i in zip(vertex_nums, range(len(vertex_nums))):
+        ids = first+np.arange(num-2, dtype=np.uint32)[:, None]+np.arange(3, dtype=np.uint32)
+        sections.append(StaticLODSection.build(i, sum([len(x) for x in indices]), num-2, first, first+num-1))
+        indices.append(ids.reshape(-1))
+        first += num
+    indices = np.concatenate(indices)
+
+    vb = PositionVertexBuffer.build(position)
+    vb2 = StaticMeshVertexBuffer.build(tangent_basis, texcoords, False)
+    ib = StaticIndexBuffer.build(indices, 1)
+    ib2 = StaticIndexBuffer.build(indices, 1, name='IB2')
+    lod = StaticLOD(None, sections, b'\x00'*4, vb, vb2, None, ib, ib2, b'\x00'*48)
+    materials = [NamedMaterial('material{}'.format(i)) for i in range(len(vertex_nums))]
+    return StaticMesh(None, materials, [lod])
+
+def load_glb_json(file):
+    with open(file, 'rb') as f:
+        f.seek(12)
+        size, chunk_type = struct.unpack('<I4s', f.read(8))
+        assert chunk_type==b'JSON'
+        return json.loads(f.read(size))
+
+#export the LOD as glb, and return the time
+def export(mesh, save_folder):
+    start = time.perf_counter()
+    gltf = glTF()
+    mesh.add_to_gltf(gltf, 'big')
+    gltf.save('big', save_folder, file_format='glb')
+    return time.perf_counter()-start
+
+def test_large_section_uses_uint32_indices(tmp_path):
+    mesh = make_static_mesh(VERTEX_NUMS)
+    run_time = export(mesh, str(tmp_path))
+
+    data = load_glb_json(os.path.join(str(tmp_path), 'big.glb'))
+    primitives = data['meshes'][0]['primitives']
+    index_types = [data['accessors'][p['indices']]['componentType'] for p in primitives]
+    assert index_types==[5123, 5125]
+    assert data['accessors'][primitives[1]['attributes']['POSITION']]['count']==VERTEX_NUMS[1]
+    assert run_time<MAX_TIME, 'export took {:.2f} s'.format(run_time)
+
+    #tracemalloc slows down the export. measure memory usage in another run.
+    tracemalloc.start()
+    export(mesh, str(tmp_path))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak<MAX_MEMORY, 'peak memory was {:.1f} MB'.format(peak/1024/1024)
@@ -0,0 +1,43 @@
+import numpy as np
+
+from gltf.meshopt import VertexEncoder, IndexEncoder
+
+#expected bytes are made by meshoptimizer 0.2.30a0
+#(encode_vertex_buffer with vertex codec v0, encode_index_buffer with index codec v1)
+
+#16 positions (stride 12)
+VERTICES = np.array([[i%4, i//4, (i*7)%5*0.25] for i in range(16)], dtype=np.float32)
+ENCODED_VERTICES = bytes.fromhex(
+    'a000000300ffff807fffff807fffff807fffff800138f8f8f87e7f7e7f7e7f7e'
+    '00000100c0c0c0ffff800100c080007e0000010cf33ccfff7f7fff7f7fff7f7f'
+    '0131bc6f1b7e7d7e7d7e7d000000000000000000000000000000000000000000'
+    '0000000000000000000000'
+)
+
+#a 4x4 grid of vertices (18 triangles)
+INDICES = np.array([[a, a+1, a+4, a+1, a+5, a+4] for a in [i*4+j for i in range(3) for j in range(3)]], dtype=np.uint16).reshape(-1)
+ENCODED_INDICES = bytes.fromhex('e1fe1e100e100e8e1e140e130e8e1e130e130e0f08007687566778a9866589689801690000')
+
+def encode_vertices(chunks):
+    encoder = VertexEncoder(12)
+    data = b''.join([encoder.encode(chunk) for chunk in chunks])
+    return data + encoder.finish()
+
+def encode_indices(chunks, index_size):
+    encoder = IndexEncoder(index_size)
+    data = b''.join([encoder.encode(chunk) for chunk in chunks])
+    return data + encoder.finish()
+
+def test_vertex_encoder():
+    assert encode_vertices([VERTICES])==ENCODED_VERTICES
+
+#vertex buffers of sections are encoded as a buffer view
+def test_vertex_encoder_with_chunks():
+    assert encode_vertices([VERTICES[:5], VERTICES[5:5], VERTICES[5:]])==ENCODED_VERTICES
+
+def test_index_encoder():
+    assert encode_indices([INDICES], 2)==ENCODED_INDICES
+    assert encode_indices([INDICES.astype(np.uint32)], 4)==ENCODED_INDICES
+
+def test_index_encoder_with_chunks():
+    assert encode_indices([INDICES[:18], INDICES[18:]], 2)==ENCODED_INDICES